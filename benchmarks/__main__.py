@@ -0,0 +1,204 @@
+"""Benchmark paaws commands against a local AWS stand-in
+
+    python -m benchmarks [--latency 0.02] [--tasks 3000] [SCENARIO...]
+
+Each scenario runs a real paaws click command in-process. The report shows
+the median wall time, the number of AWS API calls and the peak Python memory
+for each one.
+"""
+import contextlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List
+
+import click
+
+from .fake_aws import FakeAWS
+
+APP_NAME = "bench"
+
+SCENARIOS = {
+    "ps": ["ps"],
+    "ps-ndjson": ["--output", "ndjson", "ps"],
+    "ps-usage": ["ps", "--usage"],
+    "restart-all": ["restart", "--no-wait"],
+    "deployments": ["deployments"],
+    "deployments-history": ["deployments", "history"],
+    "config-list": ["config", "list"],
+    "config-get": ["config", "get", "VAR_0001"],
+    "builds-list": ["builds", "list"],
+    "builds-list-50": ["builds", "list", "--limit", "50"],
+    "builds-stats": ["builds", "stats", "--last", "500"],
+    "builds-view": ["builds", "view", "{recent_build}"],
+    "builds-view-old": ["builds", "view", "{old_build}"],
+    "builds-logs": ["builds", "logs", "{recent_build}", "build"],
+    "builds-logs-tail": ["builds", "logs", "{recent_build}", "build", "--tail", "50"],
+    "logs-view": ["logs", "view", "--prefix", "svc-001/"],
+}
+
+# Scenarios measured with the local cache left by the warm-up run, all others
+# start every run with an empty cache directory
+WARM = {
+    "ps-cached": ["ps", "--max-age", "1h"],
+    "config-list-cached": ["config", "list", "--max-age", "1h"],
+    "deployments-history-warm": ["deployments", "history"],
+    "builds-stats-warm": ["builds", "stats", "--last", "500"],
+    "builds-view-old-warm": ["builds", "view", "{old_build}"],
+}
+SCENARIOS.update(WARM)
+
+
+@contextlib.contextmanager
+def _captured_stdout():
+    """
+    Send file descriptor 1 to a temporary file. Spinners hold on to the
+    ``sys.stdout`` they were created with, so swapping the Python object alone
+    is not enough.
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with tempfile.TemporaryFile() as f:
+        os.dup2(f.fileno(), 1)
+        try:
+            yield f
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved, 1)
+            os.close(saved)
+
+
+def _reset_process_state() -> None:
+    """Clear memoized lookups so every run starts as cold as a new CLI process"""
+    for name, module in list(sys.modules.items()):
+        if name.startswith("paaws") and module is not None:
+            for obj in vars(module).values():
+                if callable(getattr(obj, "cache_clear", None)):
+                    obj.cache_clear()
+
+
+def _clear_disk_cache() -> None:
+    """Empty the local cache so a run starts like a first one on a new machine"""
+    root = os.environ["XDG_CACHE_HOME"]
+    for name in os.listdir(root):
+        shutil.rmtree(os.path.join(root, name))
+
+
+def _run_command(args: List[str], warm: bool) -> dict:
+    from paaws.__main__ import main
+
+    _reset_process_state()
+    if not warm:
+        _clear_disk_cache()
+    error = None
+    with _captured_stdout() as out:
+        try:
+            main.main(args=["--app", APP_NAME] + args, standalone_mode=False)
+        except SystemExit as e:
+            if e.code:
+                error = f"exit {e.code}"
+        except Exception as e:  # report, don't abort the whole run
+            error = f"{e.__class__.__name__}: {e}"
+        out.seek(0)
+        lines = sum(1 for _ in out)
+    return {"lines": lines, "error": error}
+
+
+def run_scenario(fake: FakeAWS, args: List[str], repeat: int, warm: bool) -> dict:
+    # every run sees the same application, whatever earlier runs changed
+    fake.reset_state()
+    # warm up botocore's model loading and import caches, and fill the local
+    # cache which warm scenarios keep
+    _run_command(args, warm=False)
+    times = []
+    calls = None
+    for _ in range(repeat):
+        fake.reset_state()
+        fake.reset_calls()
+        start = time.perf_counter()
+        result = _run_command(args, warm)
+        times.append(time.perf_counter() - start)
+        if calls is None:
+            calls = dict(fake.calls)
+    fake.reset_state()
+    tracemalloc.start()
+    _run_command(args, warm)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "args": args,
+        "wall_ms": statistics.median(times) * 1000,
+        "calls": sum(calls.values()),
+        "calls_by_operation": calls,
+        "peak_mib": peak / 1024 / 1024,
+        "lines": result["lines"],
+        "error": result["error"],
+    }
+
+
+@click.command()
+@click.option("--latency", default=0.0, help="Seconds added to every API call")
+@click.option("--tasks", default=3000, help="Running tasks in the cluster")
+@click.option("--services", default=200, help="ECS services in the cluster")
+@click.option("--parameters", default=500, help="Parameters in the parameter store")
+@click.option("--log-streams", default=5000, help="Streams in the log group")
+@click.option("--builds", default=1000, help="CodeBuild builds for the project")
+@click.option("--repeat", default=3, help="Timed runs per scenario")
+@click.option("--verbose", "-v", is_flag=True, help="Show calls per operation")
+@click.option("--json", "json_path", type=click.Path(), help="Write results to file")
+@click.argument("scenarios", nargs=-1, type=click.Choice(sorted(SCENARIOS)))
+def main(
+    latency, tasks, services, parameters, log_streams, builds, repeat, verbose, json_path, scenarios
+):
+    """Run paaws commands against a synthetic application"""
+    # Never touch real credentials, caches or endpoints
+    os.environ.update(
+        AWS_ACCESS_KEY_ID="bench",
+        AWS_SECRET_ACCESS_KEY="bench",
+        AWS_DEFAULT_REGION="us-east-1",
+        AWS_CONFIG_FILE=os.devnull,
+        AWS_SHARED_CREDENTIALS_FILE=os.devnull,
+        XDG_CACHE_HOME=tempfile.mkdtemp(prefix="paaws-bench-"),
+    )
+    os.environ.pop("AWS_PROFILE", None)
+    fake = FakeAWS(
+        app_name=APP_NAME,
+        tasks=tasks,
+        services=services,
+        parameters=parameters,
+        log_streams=log_streams,
+        builds=builds,
+        latency=latency,
+    )
+    fake.install()
+    context = {"recent_build": str(builds - 5), "old_build": str(builds // 5)}
+    results = {}
+    print(
+        f"{'scenario':<26}{'wall ms':>10}{'calls':>8}{'peak MiB':>10}{'lines':>8}",
+        file=sys.stderr,
+    )
+    for name in scenarios or sorted(SCENARIOS):
+        args = [a.format(**context) for a in SCENARIOS[name]]
+        result = results[name] = run_scenario(fake, args, repeat, name in WARM)
+        print(
+            f"{name:<26}{result['wall_ms']:>10.1f}{result['calls']:>8}"
+            f"{result['peak_mib']:>10.2f}{result['lines']:>8}"
+            + (f"  {result['error']}" if result["error"] else ""),
+            file=sys.stderr,
+        )
+        if verbose:
+            for op, count in sorted(result["calls_by_operation"].items()):
+                print(f"    {op:<40}{count:>6}", file=sys.stderr)
+    fake.uninstall()
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,769 @@
+"""In-process stand-in for the AWS APIs paaws talks to
+
+Every botocore client created while the fake is installed answers its calls
+from a synthetic, production-sized application instead of the network.
+Requests still go through botocore's parameter validation and serialization,
+so argument mistakes surface exactly as they would against AWS. Page sizes and
+batch limits mirror the real services so pagination bugs are not hidden.
+"""
+import copy
+import datetime
+import io
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import botocore.session
+from botocore import xform_name
+from botocore.response import StreamingBody
+
+PHASES = [
+    "SUBMITTED",
+    "QUEUED",
+    "PROVISIONING",
+    "DOWNLOAD_SOURCE",
+    "INSTALL",
+    "PRE_BUILD",
+    "BUILD",
+    "POST_BUILD",
+    "UPLOAD_ARTIFACTS",
+    "FINALIZING",
+    "COMPLETED",
+]
+
+
+class FakeHTTPResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.headers = {}
+
+
+class FakeAWSError(Exception):
+    def __init__(self, code: str, message: str = "", status_code: int = 400):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+        self.status_code = status_code
+
+
+def _chunk_token(items: List, params: dict, token_key: str, limit_key: str, limit: int):
+    """Slice ``items`` into a page using an integer offset as the continuation token"""
+    start = int(params.get(token_key) or 0)
+    size = min(int(params.get(limit_key) or limit), limit)
+    page = items[start : start + size]
+    token = str(start + size) if start + size < len(items) else None
+    return page, token
+
+
+class FakeAWS:
+    """Synthetic application plus request dispatch for the botocore event hooks"""
+
+    def __init__(
+        self,
+        app_name: str = "bench",
+        tasks: int = 3000,
+        services: int = 200,
+        parameters: int = 500,
+        log_streams: int = 5000,
+        builds: int = 1000,
+        latency: float = 0.0,
+        seed: int = 0,
+    ):
+        self.app_name = app_name
+        self.cluster = app_name
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._original_create_client = None
+        self._stream_lines = {}
+        self.now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        self.region = "us-east-1"
+        self.account = "123456789012"
+        self._build_task_definitions(services)
+        self._build_services(services)
+        self._build_tasks(tasks)
+        self._build_parameters(parameters)
+        self._build_log_streams(log_streams)
+        self._build_builds(builds)
+        # services only roll out after an update_service call
+        self._rolling = set()
+        self._initial_state = copy.deepcopy((self.services, self.builds))
+
+    # -- synthetic data ---------------------------------------------------
+
+    def _arn(self, service: str, resource: str) -> str:
+        return f"arn:aws:{service}:{self.region}:{self.account}:{resource}"
+
+    def _ago(self, **kwargs) -> datetime.datetime:
+        return self.now - datetime.timedelta(**kwargs)
+
+    def _build_task_definitions(self, services: int) -> None:
+        self.task_definitions = {}
+        self.task_definition_tags = {}
+        build_number = 1000
+        for i in range(services):
+            family = f"{self.app_name}-svc-{i:03d}"
+            for revision in (1, 2):
+                build_number += 1
+                arn = self._arn("ecs", f"task-definition/{family}:{revision}")
+                self.task_definitions[arn] = {
+                    "taskDefinitionArn": arn,
+                    "family": family,
+                    "revision": revision,
+                    "containerDefinitions": [
+                        {
+                            "name": "app",
+                            "image": f"{self.account}.dkr.ecr.{self.region}.amazonaws.com/{self.app_name}:{build_number}",
+                            "command": ["gunicorn", f"svc{i}.wsgi"],
+                            "cpu": 256,
+                            "memory": 512,
+                        },
+                        {
+                            "name": "log-router",
+                            "image": "amazon/aws-for-fluent-bit:latest",
+                            "cpu": 0,
+                            "memory": 64,
+                        },
+                    ],
+                }
+                self.task_definition_tags[arn] = [
+                    {"key": "paaws:buildNumber", "value": str(build_number)}
+                ]
+
+    def _service_events(self, name: str) -> List[dict]:
+        """
+        Deployments (old targets drain before the new ones register) mixed with
+        scale-outs, which look alike but aren't reported as completed deployments
+        """
+        events = []
+        ts = self._ago(days=14)
+        target_group = self._arn("elasticloadbalancing", "targetgroup/" + name)
+        while len(events) < 100 and ts < self.now:
+            if self._random.random() < 0.3:
+                task = uuid.UUID(int=self._random.getrandbits(128)).hex
+                sequence = [
+                    (0, f"(service {name}) has started 1 tasks: (task {task})."),
+                    (
+                        self._random.randint(60, 180),
+                        f"(service {name}) registered 1 targets in (target-group {target_group})",
+                    ),
+                    (self._random.randint(240, 400), f"(service {name}) has reached a steady state."),
+                ]
+            else:
+                task_ids = [uuid.UUID(int=self._random.getrandbits(128)).hex for _ in range(2)]
+                tasks = " ".join(f"(task {t})" for t in task_ids)
+                steady = self._random.randint(240, 720)
+                sequence = [
+                    (0, f"(service {name}) has started 2 tasks: {tasks}."),
+                    (
+                        self._random.randint(10, 50),
+                        f"(service {name}) deregistered 2 targets in (target-group {target_group})",
+                    ),
+                    (
+                        self._random.randint(60, 180),
+                        f"(service {name}) registered 2 targets in (target-group {target_group})",
+                    ),
+                    (steady, f"(service {name}) has reached a steady state."),
+                    (
+                        steady + 1,
+                        f"(service {name}) (deployment ecs-svc/{self._random.getrandbits(60)}) deployment completed.",
+                    ),
+                ]
+            for seconds, message in sequence:
+                events.append(
+                    {
+                        "id": str(uuid.UUID(int=self._random.getrandbits(128))),
+                        "createdAt": ts + datetime.timedelta(seconds=seconds),
+                        "message": message,
+                    }
+                )
+            ts += datetime.timedelta(hours=self._random.randint(6, 48))
+        return sorted(events, key=lambda e: e["createdAt"], reverse=True)[:100]
+
+    def _build_services(self, services: int) -> None:
+        self.services = []
+        for i in range(services):
+            name = f"svc-{i:03d}"
+            family = f"{self.app_name}-svc-{i:03d}"
+            deployments = [
+                {
+                    "id": f"ecs-svc/{self._random.getrandbits(60)}",
+                    "status": "PRIMARY",
+                    "taskDefinition": self._arn("ecs", f"task-definition/{family}:2"),
+                    "desiredCount": 2,
+                    "pendingCount": 0,
+                    "runningCount": 2,
+                    "createdAt": self._ago(hours=self._random.randint(1, 400)),
+                    "updatedAt": self._ago(minutes=30),
+                }
+            ]
+            if i % 10 == 0:
+                deployments[0].update(runningCount=1, pendingCount=1)
+                deployments.append(
+                    {
+                        "id": f"ecs-svc/{self._random.getrandbits(60)}",
+                        "status": "ACTIVE",
+                        "taskDefinition": self._arn("ecs", f"task-definition/{family}:1"),
+                        "desiredCount": 0,
+                        "pendingCount": 0,
+                        "runningCount": 1,
+                        "createdAt": self._ago(days=20),
+                        "updatedAt": self._ago(minutes=5),
+                    }
+                )
+            self.services.append(
+                {
+                    "serviceArn": self._arn("ecs", f"service/{self.cluster}/{name}"),
+                    "serviceName": name,
+                    "clusterArn": self._arn("ecs", f"cluster/{self.cluster}"),
+                    "status": "ACTIVE",
+                    "desiredCount": 2,
+                    "runningCount": deployments[0]["runningCount"],
+                    "pendingCount": deployments[0]["pendingCount"],
+                    "taskDefinition": deployments[0]["taskDefinition"],
+                    "deployments": deployments,
+                    "events": self._service_events(name),
+                    "tags": [],
+                }
+            )
+
+    def _build_tasks(self, tasks: int) -> None:
+        self.tasks = []
+        for i in range(tasks):
+            task_uuid = uuid.UUID(int=self._random.getrandbits(128)).hex
+            if i % 50 == 49:
+                # one-off tasks (shells, releases) outside of any service
+                family = f"{self.app_name}-shell"
+                group = f"family:{family}"
+                defn_arn = next(iter(self.task_definitions))
+                overrides = {
+                    "containerOverrides": [{"name": "app", "command": ["/bin/sh", "-c", "sleep 60"]}]
+                }
+            else:
+                service = self.services[i % len(self.services)]
+                group = f"service:{service['serviceName']}"
+                defn_arn = service["taskDefinition"]
+                overrides = {"containerOverrides": [{"name": "app"}]}
+            defn = self.task_definitions[defn_arn]
+            self.tasks.append(
+                {
+                    "taskArn": self._arn("ecs", f"task/{self.cluster}/{task_uuid}"),
+                    "clusterArn": self._arn("ecs", f"cluster/{self.cluster}"),
+                    "taskDefinitionArn": defn_arn,
+                    "group": group,
+                    "cpu": "256",
+                    "memory": "576",
+                    "lastStatus": "RUNNING",
+                    "desiredStatus": "RUNNING",
+                    "startedAt": self._ago(minutes=self._random.randint(1, 60 * 24 * 14)),
+                    "overrides": overrides,
+                    "containers": [
+                        {
+                            "name": cd["name"],
+                            "image": cd["image"],
+                            "lastStatus": "RUNNING",
+                        }
+                        for cd in defn["containerDefinitions"]
+                    ],
+                    "tags": [],
+                }
+            )
+
+    def _build_parameters(self, parameters: int) -> None:
+        self.parameters = {}
+        for i in range(parameters):
+            name = f"/{self.app_name}/VAR_{i:04d}"
+            self.parameters[name] = {
+                "Name": name,
+                "Type": "SecureString",
+                "Value": uuid.UUID(int=self._random.getrandbits(128)).hex,
+                "Version": self._random.randint(1, 20),
+                "LastModifiedDate": self._ago(days=self._random.randint(0, 365)),
+                "ARN": self._arn("ssm", f"parameter{name}"),
+                "DataType": "text",
+            }
+
+    def _build_log_streams(self, log_streams: int) -> None:
+        self.log_streams = []
+        for i in range(log_streams):
+            service = self.services[i % len(self.services)]["serviceName"]
+            task = uuid.UUID(int=self._random.getrandbits(128)).hex
+            if i < len(self.services) * 2:
+                # the newest tasks of each service are still logging
+                last = self._ago(seconds=self._random.randint(0, 120))
+            else:
+                last = self._ago(minutes=self._random.randint(10, 60 * 24 * 30))
+            self.log_streams.append(
+                {
+                    "logStreamName": f"{service}/app/{task}",
+                    "creationTime": int((last - datetime.timedelta(days=1)).timestamp() * 1000),
+                    "firstEventTimestamp": int((last - datetime.timedelta(days=1)).timestamp() * 1000),
+                    "lastEventTimestamp": int(last.timestamp() * 1000),
+                    "lastIngestionTime": int(last.timestamp() * 1000),
+                }
+            )
+        self.log_streams.sort(key=lambda s: s["logStreamName"])
+
+    def _build_builds(self, builds: int) -> None:
+        self.builds = {}
+        self.build_ids = []  # newest first, like list_builds_for_project
+        self.objects = {}
+        project = self.app_name
+        bucket = f"{self.app_name}-artifacts"
+        start = self.now
+        for number in range(builds, 0, -1):
+            build_id = f"{project}:{uuid.UUID(int=self._random.getrandbits(128))}"
+            phases = []
+            phase_start = start - datetime.timedelta(minutes=15)
+            in_progress = number == builds
+            for phase in PHASES:
+                duration = {
+                    "PROVISIONING": self._random.randint(20, 90),
+                    "BUILD": self._random.randint(120, 600),
+                    "UPLOAD_ARTIFACTS": self._random.randint(2, 30),
+                }.get(phase, self._random.randint(0, 10))
+                entry = {"phaseType": phase, "startTime": phase_start}
+                if in_progress and phase == "BUILD":
+                    entry["phaseStatus"] = "IN_PROGRESS"
+                    phases.append(entry)
+                    break
+                if phase != "COMPLETED":
+                    entry.update(
+                        phaseStatus="SUCCEEDED",
+                        durationInSeconds=duration,
+                        endTime=phase_start + datetime.timedelta(seconds=duration),
+                    )
+                phases.append(entry)
+                phase_start += datetime.timedelta(seconds=duration)
+            stream = build_id.split(":", 1)[1]
+            build = {
+                "id": build_id,
+                "arn": self._arn("codebuild", f"build/{build_id}"),
+                "buildNumber": number,
+                "startTime": phases[0]["startTime"],
+                "currentPhase": phases[-1]["phaseType"],
+                "buildStatus": "IN_PROGRESS" if in_progress else ("FAILED" if number % 7 == 0 else "SUCCEEDED"),
+                "sourceVersion": f"{self._random.getrandbits(160):040x}",
+                "projectName": project,
+                "phases": phases,
+                "buildComplete": not in_progress,
+                "artifacts": {"location": ""},
+                "logs": {
+                    "groupName": f"/aws/codebuild/{project}",
+                    "streamName": stream,
+                    "deepLink": "",
+                },
+            }
+            if not in_progress:
+                build["endTime"] = phases[-1]["startTime"]
+                build["artifacts"]["location"] = f"arn:aws:s3:::{bucket}/{project}/{stream}"
+                prefix = f"{project}/{stream}"
+                self.objects[(bucket, f"{prefix}/commit.txt")] = (
+                    f"commit {build['sourceVersion']}\nAuthor: Bench <bench@example.com>\n\n    Change {number}\n"
+                ).encode()
+                for log_type in ("build", "test", "release"):
+                    self.objects[(bucket, f"{prefix}/{log_type}.log")] = _LazyLog(
+                        f"{log_type}:{number}", 5000
+                    )
+            self.builds[build_id] = build
+            self.build_ids.append(build_id)
+            start -= datetime.timedelta(hours=self._random.randint(1, 12))
+
+    # -- botocore integration ---------------------------------------------
+
+    def install(self) -> None:
+        """Answer calls from every botocore client created from now on"""
+        if self._original_create_client is not None:
+            return
+        original = self._original_create_client = botocore.session.Session.create_client
+        fake = self
+
+        def create_client(session, *args, **kwargs):
+            client = original(session, *args, **kwargs)
+            client.meta.events.register("before-parameter-build", fake._capture_params)
+            client.meta.events.register("before-call", fake._dispatch)
+            return client
+
+        botocore.session.Session.create_client = create_client
+
+    def uninstall(self) -> None:
+        if self._original_create_client is not None:
+            botocore.session.Session.create_client = self._original_create_client
+            self._original_create_client = None
+        self._stream_lines = {}
+
+    def reset_calls(self) -> None:
+        with self._lock:
+            self.calls.clear()
+
+    def reset_state(self) -> None:
+        """Undo rollouts, scaling and build progress caused by earlier runs"""
+        with self._lock:
+            self.services, self.builds = copy.deepcopy(self._initial_state)
+            self._rolling = set()
+            self._stream_lines = {}
+
+    def _capture_params(self, params: dict, context: dict, **kwargs) -> None:
+        context["fake_aws_params"] = dict(params)
+
+    def _dispatch(self, model, context: dict, **kwargs) -> Tuple[FakeHTTPResponse, dict]:
+        service = model.service_model.service_name
+        operation = xform_name(model.name)
+        with self._lock:
+            self.calls[f"{service}.{operation}"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        handler: Optional[Callable] = getattr(
+            self, f"{service.replace('-', '_')}_{operation}", None
+        )
+        if handler is None:
+            raise NotImplementedError(f"{service}.{operation} is not faked")
+        try:
+            return FakeHTTPResponse(200), handler(context.get("fake_aws_params", {}))
+        except FakeAWSError as e:
+            return (
+                FakeHTTPResponse(e.status_code),
+                {"Error": {"Code": e.code, "Message": e.message}},
+            )
+
+    # -- ECS --------------------------------------------------------------
+
+    def _check_cluster(self, params: dict) -> None:
+        if params.get("cluster", "default") != self.cluster:
+            raise FakeAWSError("ClusterNotFoundException", "Cluster not found.")
+
+    def ecs_list_tasks(self, params: dict) -> dict:
+        self._check_cluster(params)
+        tasks = self.tasks
+        if "serviceName" in params:
+            tasks = [t for t in tasks if t["group"] == f"service:{params['serviceName']}"]
+        if "family" in params:
+            tasks = [
+                t
+                for t in tasks
+                if self.task_definitions[t["taskDefinitionArn"]]["family"] == params["family"]
+            ]
+        page, token = _chunk_token(
+            [t["taskArn"] for t in tasks], params, "nextToken", "maxResults", 100
+        )
+        resp = {"taskArns": page}
+        if token:
+            resp["nextToken"] = token
+        return resp
+
+    def ecs_describe_tasks(self, params: dict) -> dict:
+        self._check_cluster(params)
+        if len(params["tasks"]) > 100:
+            raise FakeAWSError(
+                "InvalidParameterException", "Tasks cannot be longer than 100."
+            )
+        by_arn = self._tasks_by_arn()
+        wanted = [by_arn.get(arn) for arn in params["tasks"]]
+        return {
+            "tasks": [t for t in wanted if t],
+            "failures": [
+                {"arn": arn, "reason": "MISSING"}
+                for arn, t in zip(params["tasks"], wanted)
+                if not t
+            ],
+        }
+
+    def _tasks_by_arn(self) -> Dict[str, dict]:
+        if getattr(self, "_task_index", None) is None:
+            self._task_index = {t["taskArn"]: t for t in self.tasks}
+        return self._task_index
+
+    def ecs_describe_task_definition(self, params: dict) -> dict:
+        arn = params["taskDefinition"]
+        if arn not in self.task_definitions:
+            matches = [
+                d
+                for d in self.task_definitions.values()
+                if arn in (d["family"], f"{d['family']}:{d['revision']}")
+            ]
+            if not matches:
+                raise FakeAWSError("ClientException", "Unable to describe task definition.")
+            arn = max(matches, key=lambda d: d["revision"])["taskDefinitionArn"]
+        resp = {"taskDefinition": self.task_definitions[arn]}
+        if "TAGS" in params.get("include", []):
+            resp["tags"] = self.task_definition_tags[arn]
+        return resp
+
+    def ecs_list_services(self, params: dict) -> dict:
+        """10 services per page unless maxResults (up to 100) is given"""
+        self._check_cluster(params)
+        params.setdefault("maxResults", 10)
+        page, token = _chunk_token(
+            [s["serviceArn"] for s in self.services], params, "nextToken", "maxResults", 100
+        )
+        resp = {"serviceArns": page}
+        if token:
+            resp["nextToken"] = token
+        return resp
+
+    def ecs_describe_services(self, params: dict) -> dict:
+        self._check_cluster(params)
+        if len(params["services"]) > 10:
+            raise FakeAWSError(
+                "InvalidParameterException", "Services cannot be longer than 10."
+            )
+        by_key = self._services_by_key()
+        for key in params["services"]:
+            if key in by_key and by_key[key]["serviceName"] in self._rolling:
+                self._progress(by_key[key])
+        return {
+            "services": [by_key[k] for k in params["services"] if k in by_key],
+            "failures": [
+                {"arn": k, "reason": "MISSING"} for k in params["services"] if k not in by_key
+            ],
+        }
+
+    def _services_by_key(self) -> Dict[str, dict]:
+        by_key = {}
+        for s in self.services:
+            by_key[s["serviceArn"]] = by_key[s["serviceName"]] = s
+        return by_key
+
+    def _progress(self, service: dict) -> None:
+        """Move a rollout one task closer to its desired state"""
+        with self._lock:
+            primary = service["deployments"][0]
+            if primary["runningCount"] < primary["desiredCount"]:
+                primary["runningCount"] += 1
+            elif primary["runningCount"] > primary["desiredCount"]:
+                primary["runningCount"] -= 1
+            for old in service["deployments"][1:]:
+                old["runningCount"] = max(old["runningCount"] - 1, 0)
+            service["deployments"] = [primary] + [
+                d for d in service["deployments"][1:] if d["runningCount"]
+            ]
+            primary["pendingCount"] = max(primary["desiredCount"] - primary["runningCount"], 0)
+            service["runningCount"] = primary["runningCount"]
+            service["pendingCount"] = primary["pendingCount"]
+            if len(service["deployments"]) == 1 and not primary["pendingCount"]:
+                self._rolling.discard(service["serviceName"])
+
+    def ecs_update_service(self, params: dict) -> dict:
+        self._check_cluster(params)
+        try:
+            service = self._services_by_key()[params["service"]]
+        except KeyError:
+            raise FakeAWSError("ServiceNotFoundException", "Service not found.")
+        with self._lock:
+            self._rolling.add(service["serviceName"])
+            primary = service["deployments"][0]
+            if "desiredCount" in params:
+                service["desiredCount"] = primary["desiredCount"] = params["desiredCount"]
+            if params.get("forceNewDeployment"):
+                for d in service["deployments"]:
+                    d["status"] = "ACTIVE"
+                    d["desiredCount"] = 0
+                service["deployments"].insert(
+                    0,
+                    dict(
+                        primary,
+                        id=f"ecs-svc/{self._random.getrandbits(60)}",
+                        status="PRIMARY",
+                        desiredCount=service["desiredCount"],
+                        pendingCount=service["desiredCount"],
+                        runningCount=0,
+                        createdAt=datetime.datetime.now(datetime.timezone.utc),
+                    ),
+                )
+        return {"service": service}
+
+    # -- SSM --------------------------------------------------------------
+
+    def ssm_get_parameter(self, params: dict) -> dict:
+        try:
+            return {"Parameter": self.parameters[params["Name"]]}
+        except KeyError:
+            raise FakeAWSError("ParameterNotFound")
+
+    def ssm_get_parameters_by_path(self, params: dict) -> dict:
+        path = params["Path"]
+        if not path.endswith("/"):
+            path += "/"
+        matches = [
+            p for name, p in sorted(self.parameters.items()) if name.startswith(path)
+        ]
+        if not params.get("Recursive"):
+            matches = [p for p in matches if "/" not in p["Name"][len(path) :]]
+        page, token = _chunk_token(matches, params, "NextToken", "MaxResults", 10)
+        if not params.get("WithDecryption"):
+            page = [dict(p, Value="****") for p in page]
+        resp = {"Parameters": page}
+        if token:
+            resp["NextToken"] = token
+        return resp
+
+    # -- CodeBuild / S3 ---------------------------------------------------
+
+    def codebuild_list_builds_for_project(self, params: dict) -> dict:
+        ids = self.build_ids
+        if params.get("sortOrder") == "ASCENDING":
+            ids = ids[::-1]
+        page, token = _chunk_token(ids, params, "nextToken", "", 100)
+        resp = {"ids": page}
+        if token:
+            resp["nextToken"] = token
+        return resp
+
+    def codebuild_batch_get_builds(self, params: dict) -> dict:
+        if len(params["ids"]) > 100:
+            raise FakeAWSError(
+                "InvalidInputException", "ids must contain at most 100 items."
+            )
+        return {
+            "builds": [self.builds[i] for i in params["ids"] if i in self.builds],
+            "buildsNotFound": [i for i in params["ids"] if i not in self.builds],
+        }
+
+    def s3_get_object(self, params: dict) -> dict:
+        try:
+            data = self.objects[(params["Bucket"], params["Key"])]
+        except KeyError:
+            raise FakeAWSError("NoSuchKey", "The specified key does not exist.", 404)
+        if isinstance(data, _LazyLog):
+            data = data.content
+        total = len(data)
+        resp = {}
+        if params.get("Range"):
+            if not total:
+                raise FakeAWSError(
+                    "InvalidRange", "The requested range is not satisfiable", 416
+                )
+            start, end = params["Range"].split("=", 1)[1].split("-")
+            if not start:
+                start, end = max(total - int(end), 0), total - 1
+            else:
+                start, end = int(start), int(end or total - 1)
+            data = data[start : end + 1]
+            resp["ContentRange"] = f"bytes {start}-{start + len(data) - 1}/{total}"
+        resp.update(
+            Body=StreamingBody(io.BytesIO(data), len(data)), ContentLength=len(data)
+        )
+        return resp
+
+    # -- CloudWatch metrics -----------------------------------------------
+
+    def cloudwatch_get_metric_data(self, params: dict) -> dict:
+        queries = params["MetricDataQueries"]
+        if len(queries) > 500:
+            raise FakeAWSError(
+                "ValidationError", "The collection MetricDataQueries must not have a size greater than 500."
+            )
+        results = []
+        for q in queries:
+            metric = q["MetricStat"]["Metric"]
+            key = (metric["MetricName"],) + tuple(
+                d["Value"] for d in metric.get("Dimensions", [])
+            )
+            rng = random.Random(str(key))
+            maximum = {"CpuUtilized": 256, "MemoryUtilized": 512}.get(metric["MetricName"], 100)
+            results.append(
+                {
+                    "Id": q["Id"],
+                    "Label": metric["MetricName"],
+                    "StatusCode": "Complete",
+                    "Timestamps": [self._ago(minutes=m) for m in range(1, 6)],
+                    "Values": [rng.uniform(0, maximum) for _ in range(5)],
+                }
+            )
+        return {"MetricDataResults": results, "Messages": []}
+
+    # -- CloudWatch Logs --------------------------------------------------
+
+    def logs_describe_log_streams(self, params: dict) -> dict:
+        streams = self.log_streams
+        if params.get("logStreamNamePrefix"):
+            streams = [
+                s
+                for s in streams
+                if s["logStreamName"].startswith(params["logStreamNamePrefix"])
+            ]
+        page, token = _chunk_token(streams, params, "nextToken", "limit", 50)
+        resp = {"logStreams": page}
+        if token:
+            resp["nextToken"] = token
+        return resp
+
+    def logs_get_log_events(self, params: dict) -> dict:
+        """
+        Build log streams. A running build writes 20 more lines every time its
+        stream is read and completes after 100 lines.
+        """
+        build = next(
+            (b for b in self.builds.values() if b["logs"]["streamName"] == params["logStreamName"]),
+            None,
+        )
+        if build is None:
+            raise FakeAWSError("ResourceNotFoundException", "The specified log stream does not exist.")
+        written = self._stream_lines.get(build["id"], 0 if not build["buildComplete"] else 100)
+        if not build["buildComplete"]:
+            written = self._stream_lines[build["id"]] = min(written + 20, 100)
+            if written == 100:
+                build.update(buildStatus="SUCCEEDED", buildComplete=True, endTime=self.now)
+        token = params.get("nextToken")
+        if token:
+            start = int(token.split("/", 1)[1])
+        elif params.get("startFromHead"):
+            start = 0
+        else:
+            start = max(written - int(params.get("limit") or 10000), 0)
+        end = min(written, start + int(params.get("limit") or 10000))
+        return {
+            "events": [
+                {
+                    "timestamp": int(self.now.timestamp() * 1000),
+                    "message": f"[Container] {build['id']} line {i}\n",
+                    "ingestionTime": int(self.now.timestamp() * 1000),
+                }
+                for i in range(start, end)
+            ],
+            "nextForwardToken": f"f/{end}",
+            "nextBackwardToken": f"b/{start}",
+        }
+
+    def logs_filter_log_events(self, params: dict) -> dict:
+        names = params.get("logStreamNames") or [
+            s["logStreamName"] for s in self.log_streams[:100]
+        ]
+        start = int(params.get("startTime") or 0)
+        events = [
+            {
+                "logStreamName": name,
+                "timestamp": max(start, int(self.now.timestamp() * 1000) - i * 1000),
+                "ingestionTime": int(self.now.timestamp() * 1000),
+                "message": f"{name} request {i} handled",
+                "eventId": f"{name}-{i}",
+            }
+            for name in names
+            for i in range(5)
+        ]
+        page, token = _chunk_token(events, params, "nextToken", "limit", 10000)
+        resp = {"events": page}
+        if token:
+            resp["nextToken"] = token
+        return resp
+
+
+class _LazyLog:
+    """Large log artifact that is only rendered the first time it is read"""
+
+    def __init__(self, name: str, lines: int):
+        self.name = name
+        self.lines = lines
+        self._content = None
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            self._content = "".join(
+                f"[{self.name}] line {i}: step output ✓\n" for i in range(self.lines)
+            ).encode("utf-8")
+        return self._content
@@ -1,12 +1,30 @@
 import click
 
 from .app import app
-from .cli import builds, config, deployments, db, logs, ps, shell
+from .cli import builds, config, deployments, db, diff, logs, ps, scale, shell
+from .output import FORMATS, output
+from .snapshot import snapshots
 
 
 @click.group()
 @click.option("app_name", "--app", "-a", help="Name of application", required=True)
-def main(app_name):
+@click.option(
+    "output_format",
+    "--output",
+    "-o",
+    type=click.Choice(FORMATS),
+    default="text",
+    help="Output format (json/ndjson disable colors and spinners)",
+)
+@click.option(
+    "--snapshot",
+    is_flag=True,
+    envvar="PAAWS_SNAPSHOT",
+    help="Store a local snapshot of what is fetched (for --cached and diff)",
+)
+def main(app_name, output_format, snapshot):
+    output.format = output_format
+    snapshots.enabled = snapshot
     if app_name:
         app.setup(name=app_name)
 
@@ -15,9 +33,12 @@ main.add_command(builds.builds)
 main.add_command(shell.shell)
 main.add_command(deployments.deployments)
 main.add_command(db.db)
+main.add_command(diff.diff)
 main.add_command(config.config)
 main.add_command(logs.logs)
 main.add_command(ps.ps)
+main.add_command(scale.scale)
+main.add_command(scale.restart)
 
 if __name__ == "__main__":
     main()
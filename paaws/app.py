@@ -1,12 +1,15 @@
 """App name state and configuration for resources"""
 import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
-from typing import List, Optional
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import boto3
 from botocore.client import ClientError
 
-from .utils import tags_match
+from .utils import ordered_map, tags_match
 
 
 class NoApplicationDefined(Exception):
@@ -108,11 +111,7 @@ class Application:
     def chamber_compatible_config(self) -> bool:
         return self.settings["parameter_store"]["chamber_compatible"]
 
-    @requires_appname
-    def get_tasks(self) -> List[dict]:
-        """List of task descriptions for app"""
-        ecs = boto3.client("ecs")
-        task_arns = ecs.list_tasks(cluster=self.cluster)["taskArns"]
+    def _describe_tasks(self, ecs, task_arns: List[str]) -> List[dict]:
         return [
             t
             for t in ecs.describe_tasks(
@@ -121,27 +120,162 @@ class Application:
             if tags_match(t.get("tags", []), self.tags)
         ]
 
+    def _iter_task_pages(self, ecs, **filters) -> Iterator[Tuple[List[str], List[dict]]]:
+        """Listed task ARNs with the descriptions of the app's tasks among them"""
+        paginator = ecs.get_paginator("list_tasks")
+        for page in paginator.paginate(
+            cluster=self.cluster, PaginationConfig={"PageSize": 100}, **filters
+        ):
+            if page["taskArns"]:
+                yield page["taskArns"], self._describe_tasks(ecs, page["taskArns"])
+
     @requires_appname
-    def get_services(self) -> List[dict]:
-        """List of service descriptions for app"""
+    def get_tasks(self) -> List[dict]:
+        """List of task descriptions for app"""
         ecs = boto3.client("ecs")
-        service_arns = ecs.list_services(cluster=self.cluster)["serviceArns"]
+        return [t for _, tasks in self._iter_task_pages(ecs) for t in tasks]
+
+    def _describe_task_groups(
+        self, ecs, task_arns: List[str], max_workers: int = 8
+    ) -> Dict[str, List[dict]]:
+        """The app's tasks among ``task_arns`` by group, described 100 at a time"""
+        chunks = [task_arns[i : i + 100] for i in range(0, len(task_arns), 100)]
+        groups = defaultdict(list)
+        describe = lambda chunk: self._describe_tasks(ecs, chunk)
+        for tasks in ordered_map(describe, chunks, max_workers):
+            for t in tasks:
+                groups[t["group"]].append(t)
+        return groups
+
+    @requires_appname
+    def iter_task_groups(
+        self, max_workers: int = 8
+    ) -> Iterator[Tuple[str, List[dict]]]:
+        """
+        (group, tasks) as soon as each group is complete. A cluster with a single
+        page of tasks is described in one go and yielded in group order. Larger
+        ones have the tasks of each service listed and described concurrently,
+        in service name order, followed by standalone tasks grouped by family.
+        """
+        ecs = boto3.client("ecs")
+        pages = iter(
+            ecs.get_paginator("list_tasks").paginate(
+                cluster=self.cluster, PaginationConfig={"PageSize": 100}
+            )
+        )
+        first = next(pages, {"taskArns": []})
+        if not first.get("nextToken"):
+            groups = self._describe_task_groups(ecs, first["taskArns"], max_workers)
+            for group in sorted(groups.keys()):
+                yield group, groups[group]
+            return
+
+        # every task listed for a service, even those of other apps (filtered
+        # out by tags), so the standalone tasks can be told apart
+        seen = set()
+
+        def service_tasks(name: str) -> List[dict]:
+            tasks = []
+            for task_arns, described in self._iter_task_pages(ecs, serviceName=name):
+                seen.update(task_arns)
+                tasks.extend(described)
+            return tasks
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # the rest of the cluster is listed while services are described
+            rest = executor.submit(lambda: [arn for p in pages for arn in p["taskArns"]])
+            if self.tags:
+                # in a shared cluster only list tasks of the app's (tagged) services
+                names = sorted(s["serviceName"] for b in self.iter_services() for s in b)
+            else:
+                names = sorted(self.iter_service_names())
+            for tasks in ordered_map(service_tasks, names, max_workers):
+                if tasks:
+                    yield tasks[0]["group"], tasks
+            cluster_arns = first["taskArns"] + rest.result()
+        unseen = [arn for arn in cluster_arns if arn not in seen]
+        groups = self._describe_task_groups(ecs, unseen, max_workers)
+        # skip service tasks started since their service was listed
+        for group in sorted(g for g in groups.keys() if not g.startswith("service:")):
+            yield group, groups[group]
+
+    def _describe_service_chunk(self, ecs, services: List[str]) -> List[dict]:
         return [
             s
             for s in ecs.describe_services(
-                cluster=self.cluster, services=service_arns, include=["TAGS"]
+                cluster=self.cluster, services=services, include=["TAGS"]
             )["services"]
             if tags_match(s.get("tags", []), self.tags)
         ]
 
     @requires_appname
-    def get_builds(self, limit=20):
+    def describe_services(self, services: List[str], max_workers: int = 8) -> List[dict]:
+        """Descriptions of services (names or ARNs), fetched concurrently in chunks of 10"""
+        ecs = boto3.client("ecs")
+        chunks = [services[i : i + 10] for i in range(0, len(services), 10)]
+        describe = lambda chunk: self._describe_service_chunk(ecs, chunk)
+        return [
+            s for described in ordered_map(describe, chunks, max_workers) for s in described
+        ]
+
+    @requires_appname
+    def iter_service_names(self) -> Iterator[str]:
+        """Names of the services in the app's cluster"""
+        ecs = boto3.client("ecs")
+        paginator = ecs.get_paginator("list_services")
+        for page in paginator.paginate(
+            cluster=self.cluster, PaginationConfig={"PageSize": 100}
+        ):
+            for arn in page["serviceArns"]:
+                yield arn.split("/")[-1]
+
+    @requires_appname
+    def iter_services(self, max_workers: int = 8) -> Iterator[List[dict]]:
+        """
+        Service descriptions for app in batches of up to 10, in listing order,
+        yielded as soon as each describe_services call returns
+        """
+        ecs = boto3.client("ecs")
+        names = iter(self.iter_service_names())
+        chunks = iter(lambda: list(islice(names, 10)), [])
+        describe = lambda chunk: self._describe_service_chunk(ecs, chunk)
+        yield from ordered_map(describe, chunks, max_workers)
+
+    @requires_appname
+    def get_services(self) -> List[dict]:
+        """List of service descriptions for app"""
+        return [s for batch in self.iter_services() for s in batch]
+
+    @requires_appname
+    def iter_build_id_pages(self) -> Iterator[List[str]]:
+        """Pages of build ids for the project, newest first"""
         codebuild = boto3.client("codebuild")
-        return codebuild.batch_get_builds(
-            ids=codebuild.list_builds_for_project(
-                projectName=self.settings["codebuild_project"]["name"]
-            )["ids"][:limit]
-        )["builds"]
+        paginator = codebuild.get_paginator("list_builds_for_project")
+        for page in paginator.paginate(
+            projectName=self.settings["codebuild_project"]["name"],
+            sortOrder="DESCENDING",
+        ):
+            yield page["ids"]
+
+    def batch_get_builds(self, ids: List[str], max_workers: int = 8) -> List[dict]:
+        """Build descriptions for ids, fetched concurrently in chunks of 100"""
+        codebuild = boto3.client("codebuild")
+        chunks = [ids[i : i + 100] for i in range(0, len(ids), 100)]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks) or 1)) as executor:
+            results = executor.map(
+                lambda chunk: codebuild.batch_get_builds(ids=chunk)["builds"], chunks
+            )
+            by_id = {b["id"]: b for builds in results for b in builds}
+        # keep the requested order, the API doesn't promise it
+        return [by_id[i] for i in ids if i in by_id]
+
+    @requires_appname
+    def get_builds(self, limit=20) -> List[dict]:
+        """Most recent build descriptions, newest first"""
+        ids = list(
+            islice((i for page in self.iter_build_id_pages() for i in page), limit)
+        )
+        return self.batch_get_builds(ids)
 
 
 app = Application()
@@ -0,0 +1,36 @@
+"""Local storage for data which is expensive to fetch from AWS"""
+import json
+import os
+import tempfile
+from pathlib import Path
+
+
+def cache_dir(app_name: str) -> Path:
+    """Directory for cached data of an application (honors XDG_CACHE_HOME)"""
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return Path(root) / "paaws" / app_name
+
+
+def load(app_name: str, name: str) -> dict:
+    """Read a cached JSON document, empty if missing or unreadable"""
+    try:
+        with open(cache_dir(app_name) / f"{name}.json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save(app_name: str, name: str, data: dict) -> None:
+    """Atomically replace a cached JSON document"""
+    directory = cache_dir(app_name)
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(directory), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, str(directory / f"{name}.json"))
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -1,29 +1,151 @@
+import codecs
 import logging
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import indent
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 import boto3
 import click
+from botocore.client import ClientError
 from halo import Halo
 from termcolor import cprint, colored
 
+from .. import cache
 from ..app import app
-from ..utils import formatted_time_ago
+from ..output import output
+from ..utils import format_duration, formatted_time_ago, percentile, spinner
 
 log = logging.getLogger(__name__)
 
 
-def get_artifact(build: dict, name: str) -> str:
-    if not build["artifacts"]["location"]:
-        log.debug("No artifacts stored by Codebuild. Skipping download of %s", name)
-        return ""
+def _artifact_key(build: dict, name: str) -> Tuple[str, str]:
+    """S3 bucket and key of a build artifact"""
     artifact_arn = build["artifacts"]["location"]
     parts = ":".join(artifact_arn.split(":")[5:])
     bucket, key_prefix = parts.split("/", 1)
-    s3 = boto3.client("s3")
-    body = s3.get_object(Bucket=bucket, Key=f"{key_prefix}/{name}")["Body"]
+    return bucket, f"{key_prefix}/{name}"
+
+
+def get_artifact(build: dict, name: str, s3=None) -> str:
+    if not build["artifacts"]["location"]:
+        log.debug("No artifacts stored by Codebuild. Skipping download of %s", name)
+        return ""
+    bucket, key = _artifact_key(build, name)
+    s3 = s3 or boto3.client("s3")
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"]
     return body.read().decode("utf-8")
 
 
+def stream_artifact(build: dict, name: str, chunk_size: int = 64 * 1024) -> Iterator[str]:
+    """Decoded text of an artifact, as it is downloaded"""
+    if not build["artifacts"]["location"]:
+        log.debug("No artifacts stored by Codebuild. Skipping download of %s", name)
+        return
+    bucket, key = _artifact_key(build, name)
+    body = boto3.client("s3").get_object(Bucket=bucket, Key=key)["Body"]
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in body.iter_chunks(chunk_size):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+def tail_artifact(build: dict, name: str, lines: int, chunk_size: int = 16 * 1024) -> str:
+    """
+    Last lines of an artifact using ranged GETs from the end of the object,
+    doubling the range until enough lines have been read.
+    """
+    if not build["artifacts"]["location"]:
+        log.debug("No artifacts stored by Codebuild. Skipping download of %s", name)
+        return ""
+    bucket, key = _artifact_key(build, name)
+    s3 = boto3.client("s3")
+    size = chunk_size
+    while True:
+        try:
+            resp = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes=-{size}")
+        except ClientError as e:
+            # S3 can't satisfy a suffix range on an empty object
+            if e.response["Error"]["Code"] == "InvalidRange":
+                return ""
+            raise
+        data = resp["Body"].read()
+        total = int(resp.get("ContentRange", "/0").rsplit("/", 1)[1] or 0)
+        complete = len(data) >= total
+        # a trailing newline ends the last line rather than starting a new one
+        if data.rstrip(b"\n").count(b"\n") >= lines or complete:
+            break
+        size *= 2
+    if not complete:
+        # drop the (possibly partial) first line
+        data = data.split(b"\n", 1)[1]
+    return "".join(
+        data.decode("utf-8", errors="replace").splitlines(keepends=True)[-lines:]
+    )
+
+
+def follow_build_log(
+    build: dict, tail: int = 0, min_interval: float = 1, max_interval: float = 10
+) -> None:
+    """
+    Print the CloudWatch log stream of a build as it is written until the build
+    completes. Polling backs off while the stream is idle and speeds up again as
+    soon as new events arrive.
+    """
+    interval = min_interval
+    # queued/provisioning builds don't have a log stream yet
+    while not build.get("logs", {}).get("streamName"):
+        if build["buildComplete"]:
+            raise Exception("Build is not logging to CloudWatch")
+        time.sleep(interval)
+        interval = min(interval * 2, max_interval)
+        build = app.batch_get_builds([build["id"]])[0]
+    logs = boto3.client("logs")
+    stream = {
+        "logGroupName": build["logs"]["groupName"],
+        "logStreamName": build["logs"]["streamName"],
+    }
+
+    def get_log_events(**kwargs) -> dict:
+        try:
+            return logs.get_log_events(**kwargs)
+        except logs.exceptions.ResourceNotFoundException:
+            # CodeBuild names the stream before creating it
+            return {"events": [], "nextForwardToken": kwargs.get("nextToken")}
+
+    kwargs = dict(stream, startFromHead=True)
+    if tail:
+        # without startFromHead the newest events are returned
+        resp = get_log_events(limit=tail, **stream)
+        for event in resp["events"]:
+            sys.stdout.write(event["message"])
+        sys.stdout.flush()
+        if resp["nextForwardToken"]:
+            kwargs["nextToken"] = resp["nextForwardToken"]
+    interval = min_interval
+    complete = False
+    while True:
+        resp = get_log_events(**kwargs)
+        for event in resp["events"]:
+            sys.stdout.write(event["message"])
+        sys.stdout.flush()
+        has_more = resp["nextForwardToken"] != kwargs.get("nextToken")
+        if resp["nextForwardToken"]:
+            kwargs["nextToken"] = resp["nextForwardToken"]
+        if resp["events"] or has_more:
+            interval = min_interval
+            continue
+        if complete:
+            break
+        # stream is drained, read it once more after the build finishes
+        complete = app.batch_get_builds([build["id"]])[0]["buildComplete"]
+        if not complete:
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
+
+
 STATUS_MAP = {
     "IN_PROGRESS": "info",
     "SUCCEEDED": "succeed",
@@ -31,35 +153,138 @@ STATUS_MAP = {
 }
 
 
-def print_build(build: dict) -> None:
+def build_record(build: dict, s3=None) -> dict:
+    """Flatten a build description into what ``builds`` displays"""
+    s3 = s3 or boto3.client("s3")
+    try:
+        commit = get_artifact(build, "commit.txt", s3)
+    except s3.exceptions.NoSuchKey:
+        commit = ""
+    return {
+        "buildNumber": build["buildNumber"],
+        "status": build["buildStatus"],
+        "sourceVersion": build["sourceVersion"],
+        "startTime": build["startTime"],
+        "endTime": build.get("endTime"),
+        "commit": commit,
+    }
+
+
+def print_build(record: dict) -> None:
     first_line = [
         colored("===", attrs=["dark"]),
-        colored(str(build["buildNumber"]), "white"),
+        colored(str(record["buildNumber"]), "white"),
     ]
-    if build["buildStatus"] == "IN_PROGRESS":
+    if record["status"] == "IN_PROGRESS":
         first_line.append("in progress")
-    first_line.append(colored(build["sourceVersion"], "blue"))
+    first_line.append(colored(record["sourceVersion"], "blue"))
     getattr(
-        Halo(text=" ".join(first_line), placement="right"),
-        STATUS_MAP[build["buildStatus"]],
+        Halo(text=" ".join(first_line), placement="right"), STATUS_MAP[record["status"]],
     )()
-    if "endTime" in build:
-        print(indent(formatted_time_ago(build["endTime"]), 4 * " "))
+    if record["endTime"]:
+        print(indent(formatted_time_ago(record["endTime"]), 4 * " "))
     else:
-        print(indent("started " + formatted_time_ago(build["startTime"]), 4 * " "))
+        print(indent("started " + formatted_time_ago(record["startTime"]), 4 * " "))
+    cprint(indent(record["commit"], 4 * " "))
+
+
+def build_records(builds: Iterable[dict], max_workers: int = 8) -> Iterator[dict]:
+    """Records for builds, in order, with commit artifacts downloaded concurrently"""
     s3 = boto3.client("s3")
-    try:
-        cprint(indent(get_artifact(build, "commit.txt"), 4 * " "))
-    except s3.exceptions.NoSuchKey:
-        print("")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from executor.map(lambda b: build_record(b, s3), builds)
 
 
-def find_build_by_number(build_number: int, limit: int = 20) -> dict:
-    builds = app.get_builds(limit=limit)
+def find_build_by_number(build_number: int) -> dict:
+    """
+    Look up a build by number using the local buildNumber -> id index, paging
+    through the project's builds (newest first) for numbers not indexed yet.
+    """
+    build_number = int(build_number)
+    index = cache.load(app.name, "build-index")
+    if str(build_number) in index:
+        builds = app.batch_get_builds([index[str(build_number)]])
+        if builds:
+            return builds[0]
+    numbers = {build_id: int(n) for n, build_id in index.items()}
     try:
-        return [b for b in builds if b["buildNumber"] == int(build_number)][0]
-    except IndexError:
-        raise Exception("Not found")
+        for ids in app.iter_build_id_pages():
+            missing = [i for i in ids if i not in numbers]
+            for b in app.batch_get_builds(missing) if missing else []:
+                numbers[b["id"]] = b["buildNumber"]
+                index[str(b["buildNumber"])] = b["id"]
+                if b["buildNumber"] == build_number:
+                    return b
+            # later pages only hold older builds with lower numbers
+            if min((numbers[i] for i in ids if i in numbers), default=0) < build_number:
+                break
+    finally:
+        cache.save(app.name, "build-index", index)
+    raise Exception("Not found")
+
+
+def _phase_summary(build: dict) -> dict:
+    """Compact description of a finished build's phase timings"""
+    return {
+        "buildNumber": build["buildNumber"],
+        "startTime": build["startTime"].isoformat(),
+        "status": build["buildStatus"],
+        "duration": (build["endTime"] - build["startTime"]).total_seconds(),
+        "phases": {
+            p["phaseType"]: p["durationInSeconds"]
+            for p in build.get("phases", [])
+            if "durationInSeconds" in p
+        },
+    }
+
+
+def load_phase_summaries(last: int) -> List[dict]:
+    """
+    Phase timings of the last builds, oldest first. Finished builds are cached
+    locally so only builds which weren't seen before are described.
+    """
+    cached = cache.load(app.name, "build-phases")
+    ids = []
+    for page in app.iter_build_id_pages():
+        ids.extend(page[: last - len(ids)])
+        if len(ids) >= last:
+            break
+    missing = [i for i in ids if i not in cached]
+    if missing:
+        index = cache.load(app.name, "build-index")
+        for b in app.batch_get_builds(missing):
+            index[str(b["buildNumber"])] = b["id"]
+            if b["buildComplete"]:
+                cached[b["id"]] = _phase_summary(b)
+        cache.save(app.name, "build-phases", cached)
+        cache.save(app.name, "build-index", index)
+    return [cached[i] for i in reversed(ids) if i in cached]
+
+
+def phase_stats(summaries: List[dict], buckets: int) -> Iterator[dict]:
+    """
+    Duration percentiles per phase with the median over consecutive windows.
+    ``summaries`` should only hold builds which ran every phase (succeeded).
+    """
+    durations: Dict[str, List[Tuple[int, float]]] = {}
+    for idx, summary in enumerate(summaries):
+        for phase, seconds in summary["phases"].items():
+            durations.setdefault(phase, []).append((idx, seconds))
+        durations.setdefault("TOTAL", []).append((idx, summary["duration"]))
+    window = max(math.ceil(len(summaries) / buckets), 1)
+    for phase, timings in durations.items():
+        values = [seconds for _, seconds in timings]
+        windows: Dict[int, List[float]] = {}
+        for idx, seconds in timings:
+            windows.setdefault(idx // window, []).append(seconds)
+        yield {
+            "phase": phase,
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p90": percentile(values, 90),
+            "max": max(values),
+            "trend": [percentile(windows[w], 50) for w in sorted(windows)],
+        }
 
 
 @click.group()
@@ -69,18 +294,24 @@ def builds():
 
 
 @builds.command()
-def list():
+@click.option("--limit", "-n", default=5, help="Number of builds to show")
+def list(limit):
     """List most recent builds"""
-    for b in app.get_builds(limit=5):
-        print_build(b)
+    records = build_records(app.get_builds(limit=limit))
+    if output.structured:
+        return output.emit(records)
+    for record in records:
+        print_build(record)
 
 
 @builds.command()
 @click.argument("id")
 def view(id):
     """View status for a specific build"""
-    build = find_build_by_number(id)
-    print_build(build)
+    record = build_record(find_build_by_number(id))
+    if output.structured:
+        return output.emit_one(record)
+    print_build(record)
 
 
 @builds.command()
@@ -88,7 +319,82 @@ def view(id):
 @click.argument(
     "log_type", type=click.Choice(["build", "test", "release"]), default="test"
 )
-def logs(id, log_type):
+@click.option(
+    "--follow", "-f", is_flag=True, help="Stream output of a running build live"
+)
+@click.option("--tail", "-t", default=0, help="Only show the last N lines")
+def logs(id, log_type, follow, tail):
     """View build or test logs for a specific build"""
-    with Halo(f"downloading {log_type} log", spinner="dots"):
-        print("\n" + get_artifact(find_build_by_number(id), f"{log_type}.log"))
+    with spinner(f"finding build {id}", spinner="dots"):
+        build = find_build_by_number(id)
+    if not build["buildComplete"]:
+        if not follow:
+            cprint("Build is in progress, use --follow to stream its output", "yellow")
+            exit(1)
+        spinner(text=f"following build {id} log", spinner="dots").info()
+        return follow_build_log(build, tail=tail)
+    print("")
+    if tail:
+        sys.stdout.write(tail_artifact(build, f"{log_type}.log", tail))
+        return
+    for text in stream_artifact(build, f"{log_type}.log"):
+        sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+@builds.command()
+@click.option("--last", "-n", default=100, help="Number of builds to analyze")
+@click.option("--buckets", default=4, help="Time windows for the trend column")
+def stats(last, buckets):
+    """Phase timing statistics over recent builds"""
+    with spinner(text=f"fetching {last} builds", spinner="dots"):
+        summaries = load_phase_summaries(last)
+    # failed/stopped builds end early and would hide slowdowns of the later phases
+    excluded: Dict[str, int] = {}
+    for summary in summaries:
+        if summary["status"] != "SUCCEEDED":
+            excluded[summary["status"]] = excluded.get(summary["status"], 0) + 1
+    summaries = [s for s in summaries if s["status"] == "SUCCEEDED"]
+    records = (
+        dict(record, excluded=excluded) for record in phase_stats(summaries, buckets)
+    )
+    if output.structured:
+        return output.emit(records)
+    if not summaries:
+        print("No successful builds")
+        return
+    print(
+        colored("===", attrs=["dark"]),
+        colored(
+            "builds {first}-{last} ({count} succeeded)".format(
+                first=summaries[0]["buildNumber"],
+                last=summaries[-1]["buildNumber"],
+                count=len(summaries),
+            ),
+            "white",
+        ),
+    )
+    if excluded:
+        cprint(
+            "excluded: "
+            + ", ".join(
+                f"{count} {status.lower().replace('_', ' ')}"
+                for status, count in sorted(excluded.items())
+            ),
+            attrs=["dark"],
+        )
+    cprint(
+        "{:<18}{:>8}{:>8}{:>8}   {}".format(
+            "phase", "p50", "p90", "max", "trend (p50, oldest to newest)"
+        ),
+        attrs=["dark"],
+    )
+    for record in records:
+        print(
+            colored("{:<18}".format(record["phase"]), "green")
+            + "".join(
+                "{:>8}".format(format_duration(record[k])) for k in ("p50", "p90", "max")
+            )
+            + "   "
+            + colored(" → ".join(format_duration(t) for t in record["trend"]), "blue")
+        )
@@ -1,33 +1,30 @@
-from typing import Dict
-
-from halo import Halo
+from typing import Iterable, Iterator, Tuple
 
 import boto3
 import click
 from termcolor import colored
 
 from ..app import app
-from ..utils import halo_success
+from ..output import output
+from ..snapshot import cached_options, cached_section, snapshots
+from ..utils import halo_success, print_snapshot_age, spinner
 
 
-@Halo(text="fetching parameters", spinner="dots")
-def load_parameters(path, next_token=None) -> Dict[str, str]:
-    """Fetch values from AWS Parameter Store"""
+def iter_parameter_details(path: str) -> Iterator[Tuple[str, dict]]:
+    """Yield (key, parameter) pairs from AWS Parameter Store as each page arrives"""
     ssm = boto3.client("ssm")
     # allow lookups when IAM only allows {arn}/*
     if not path.endswith("/"):
         path += "/"
-    kwargs = {"Path": path, "WithDecryption": True}
-    if next_token:
-        kwargs.update({"NextToken": next_token})
-    results = ssm.get_parameters_by_path(**kwargs)
     transform_key = lambda k: k.upper() if app.chamber_compatible_config else k
-    parameters = {
-        transform_key(p["Name"][len(path) :]): p["Value"] for p in results["Parameters"]
-    }
-    if "NextToken" in results:
-        parameters.update(load_parameters(path, results["NextToken"]))
-    return parameters
+    kwargs = {"Path": path, "WithDecryption": True}
+    while True:
+        results = ssm.get_parameters_by_path(**kwargs)
+        for p in results["Parameters"]:
+            yield transform_key(p["Name"][len(path) :]), p
+        if "NextToken" not in results:
+            break
+        kwargs["NextToken"] = results["NextToken"]
 
 
 @click.group()
@@ -36,22 +33,54 @@ def config():
     pass
 
 
+def parameter_records(path: str) -> Iterator[dict]:
+    for key, p in iter_parameter_details(path):
+        yield {"name": key, "value": p["Value"], "version": p.get("Version")}
+
+
+def _print_parameters(records: Iterable[dict]) -> None:
+    records = sorted(records, key=lambda r: r["name"])
+    cell_width = max([len(r["name"]) for r in records], default=0) + 1
+    for r in records:
+        if "value" in r:
+            value = r["value"]
+        else:
+            value = colored(f"[version {r['version']}]", attrs=["dark"])
+        print(
+            colored(
+                "{0: <{width}}".format(r["name"].lstrip("/") + ":", width=cell_width),
+                "green",
+            ),
+            value,
+        )
+
+
 @config.command("list")
-def list_() -> None:
+@cached_options
+def list_(max_age) -> None:
     """Environment variables for applications"""
+    # Snapshots never store values, only which parameters exist and their version
+    cached = cached_section("parameters", max_age)
+    if cached:
+        records = iter(cached["records"])
+    else:
+        records = snapshots.tee(
+            "parameters",
+            parameter_records(app.parameter_prefix),
+            project=lambda r: {"name": r["name"], "version": r["version"]},
+        )
+    if output.structured:
+        return output.emit(records)
     print(
         colored("===", attrs=["dark"]),
         colored(f"{app.name} Config Vars", "white", attrs=["bold"]),
     )
-    parameters = load_parameters(app.parameter_prefix)
-    cell_width = max([len(k) for k in parameters.keys()]) + 1
-    for k in sorted(load_parameters(f"/{app.name}").keys()):
-        print(
-            colored(
-                "{0: <{width}}".format(k.lstrip("/") + ":", width=cell_width), "green"
-            ),
-            parameters[k],
-        )
+    if cached:
+        print_snapshot_age(cached)
+        return _print_parameters(records)
+    with spinner(text="fetching parameters", spinner="dots"):
+        records = list(records)
+    _print_parameters(records)
 
 
 @config.command()
@@ -62,7 +91,10 @@ def get(key: str) -> None:
     if app.chamber_compatible_config:
         key = key.lower()
     name = "/".join([app.parameter_prefix, key])
-    print(ssm.get_parameter(Name=name, WithDecryption=True)["Parameter"]["Value"])
+    value = ssm.get_parameter(Name=name, WithDecryption=True)["Parameter"]["Value"]
+    if output.structured:
+        return output.emit_one({"name": key, "value": value})
+    print(value)
 
 
 @config.command()
@@ -1,24 +1,97 @@
+import datetime
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import boto3
 import click
 from blessed import Terminal
 from halo import Halo
-from termcolor import colored
+from termcolor import colored, cprint
 
+from .. import cache
 from ..app import app
-from ..utils import formatted_time_ago
+from ..output import output
+from ..snapshot import cached_options, cached_section, snapshots
+from ..utils import (
+    format_duration,
+    formatted_time_ago,
+    ordered_map,
+    percentile,
+    print_snapshot_age,
+    spinner,
+    spinning,
+)
 
 
-def deployment_id(detail: dict) -> str:
-    ecs = boto3.client("ecs")
-    resp = ecs.describe_task_definition(
-        taskDefinition=detail["taskDefinition"], include=["TAGS"]
-    )
+@lru_cache(maxsize=None)
+def _ecs_client():
+    # shared by the threads describing task definitions, creating a client
+    # is slow and not thread-safe so it's created before they start
+    return boto3.client("ecs")
+
+
+@lru_cache(maxsize=None)
+def _task_definition_id(task_definition: str) -> str:
+    # task definitions are immutable, so they're only described once per run
+    resp = _ecs_client().describe_task_definition(taskDefinition=task_definition, include=["TAGS"])
     try:
         return [t for t in resp["tags"] if t["key"] == "paaws:buildNumber"][0]["value"]
     except IndexError:
-        return detail["taskDefinition"].split("/")[-1]
+        return task_definition.split("/")[-1]
+
+
+def deployment_id(detail: dict) -> str:
+    return _task_definition_id(detail["taskDefinition"])
+
+
+def prefetch_deployment_ids(services: List[dict], max_workers: int = 8) -> None:
+    """Describe the task definitions of all deployments concurrently"""
+    arns = {d["taskDefinition"] for s in services for d in s["deployments"]}
+    _ecs_client()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _ in executor.map(_task_definition_id, arns):
+            pass
+
+
+def check_service_names(names: Iterable[str], services: List[dict]) -> None:
+    """Exit listing the app's services if any of ``names`` isn't one of them"""
+    known = [s["serviceName"] for s in services]
+    unknown = [n for n in names if n not in known]
+    if unknown:
+        cprint(f"Unknown service(s): {', '.join(unknown)}", "red")
+        print("Available services:", ", ".join(sorted(known)))
+        exit(1)
+
+
+def is_steady(service: dict) -> bool:
+    """Has the service finished rolling out and reached its desired count?"""
+    return len(service["deployments"]) == 1 and (
+        service["deployments"][0]["runningCount"]
+        == service["deployments"][0]["desiredCount"]
+    )
+
+
+def deployment_record(deployment: dict) -> dict:
+    return {
+        "id": deployment_id(deployment),
+        "status": deployment["status"],
+        "taskDefinition": deployment["taskDefinition"],
+        "desiredCount": deployment["desiredCount"],
+        "pendingCount": deployment["pendingCount"],
+        "runningCount": deployment["runningCount"],
+        "createdAt": deployment["createdAt"],
+    }
+
+
+def service_record(service: dict) -> dict:
+    """Flatten a service description into what ``deployments`` displays"""
+    return {
+        "service": service["serviceName"],
+        "deployments": [deployment_record(d) for d in service["deployments"]],
+    }
 
 
 def _deployment_line(deployment: dict) -> str:
@@ -27,7 +100,7 @@ def _deployment_line(deployment: dict) -> str:
         "ACTIVE": "yellow",
     }
     line = [
-        deployment_id(deployment),
+        deployment["id"],
         ": ",
         colored(deployment["status"].lower(), color_map.get(deployment["status"], "")),
         colored(" tasks:{runningCount}".format(**deployment), "white"),
@@ -43,45 +116,92 @@ def _deployment_line(deployment: dict) -> str:
     return "".join(line)
 
 
-def _service_status_lines(service):
+def _service_status_lines(record: dict) -> List[str]:
     return (
-        [colored("=== ", attrs=["dark"]) + colored(service["serviceName"], "green")]
-        + [_deployment_line(d) for d in service["deployments"]]
+        [colored("=== ", attrs=["dark"]) + colored(record["service"], "green")]
+        + [_deployment_line(d) for d in record["deployments"]]
         + [""]
     )
 
 
-@click.command()
+def _with_deployment_ids(services: List[dict]) -> List[dict]:
+    for service in services:
+        for d in service["deployments"]:
+            deployment_id(d)
+    return services
+
+
+def service_records() -> Iterator[dict]:
+    """Service records, rendered batch by batch as services are described"""
+    _ecs_client()
+    # look up deployment ids of the next batches while one is rendered
+    batches = ordered_map(_with_deployment_ids, app.iter_services())
+    for services in spinning(batches, "fetching deployments"):
+        for service in services:
+            yield service_record(service)
+
+
+@click.group(invoke_without_command=True)
 @click.option("--watch", "-w", default=False, is_flag=True)
-def deployments(watch):
+@cached_options
+@click.pass_context
+def deployments(ctx, watch, max_age):
     """List deployments"""
+    if ctx.invoked_subcommand:
+        return
     if watch:
+        if output.structured:
+            return output.emit(_watch_records())
         return _watch_deployment()
-    with Halo(text="fetching deployments", spinner="dots"):
-        services = app.get_services()
+    cached = cached_section("services", max_age)
+    if cached:
+        records = iter(cached["records"])
+    else:
+        records = snapshots.tee("services", service_records())
+    if output.structured:
+        return output.emit(records)
+    if cached:
+        print_snapshot_age(cached)
+    for record in records:
+        print("\n".join(_service_status_lines(record)))
 
-    for service in services:
-        print("\n".join(_service_status_lines(service)))
+
+def _watch_records(refresh_interval: int = 5) -> Iterator[dict]:
+    """Service records for every refresh until all deployments have settled"""
+    while True:
+        services = app.get_services()
+        for service in services:
+            yield service_record(service)
+        if all(is_steady(s) for s in services):
+            break
+        time.sleep(refresh_interval)
 
 
-def _watch_deployment():
+def _watch_deployment(service_names: Optional[List[str]] = None):
+    """
+    Redraw the deployments of services until all of them are steady. Only
+    ``service_names`` are polled if given, with batched describe_services calls.
+    """
+    fetch = (
+        (lambda: app.describe_services(service_names))
+        if service_names
+        else app.get_services
+    )
     with Halo(text="fetching deployments", spinner="dots"):
-        services = app.get_services()
-    ready = [False for s in services]
+        services = fetch()
+        prefetch_deployment_ids(services)
     term = Terminal()
     height = 0
     refresh_interval = 5
     while True:
         text = []
-        for idx, service in enumerate(services):
-            text.extend(_service_status_lines(service))
-            if len(service["deployments"]) == 1:
-                ready[idx] = True
+        for service in services:
+            text.extend(_service_status_lines(service_record(service)))
         # clear screen
         if height:
             print(term.move_up(height) + term.clear_eos)
         print("\n".join(text))
-        if all(ready):
+        if all(is_steady(s) for s in services):
             break
         print("")
         for i in range(refresh_interval):
@@ -94,5 +214,176 @@ def _watch_deployment():
             time.sleep(1)
 
         height = len(text) + 2
-        services = app.get_services()
+        services = fetch()
     Halo(text="ready", text_color="green").succeed()
+
+
+# Service event messages marking the phases of a rollout
+EVENT_KINDS = [
+    ("completed", re.compile(r"\(deployment (\S+)\) deployment completed")),
+    ("started", re.compile(r"has started \d+ tasks?")),
+    # not "deregistered", old tasks often drain before new ones register
+    ("healthy", re.compile(r"(?<!de)registered \d+ targets?")),
+    ("steady", re.compile(r"has reached a steady state")),
+    ("problem", re.compile(r"unable to|failed|unhealthy|rolling back", re.IGNORECASE)),
+]
+
+# Events kept per service in the local history
+MAX_EVENTS = 2000
+
+# Bumped whenever the classification of events changes
+EVENTS_CACHE = "service-events-v2"
+
+
+def _event_kind(message: str) -> Optional[Tuple[str, Optional[str]]]:
+    """Kind of a rollout event and its detail (the deployment id if completed)"""
+    for kind, pattern in EVENT_KINDS:
+        match = pattern.search(message)
+        if match:
+            return kind, match.group(1) if match.groups() else None
+    return None
+
+
+def load_service_events(services: List[dict]) -> Dict[str, List[list]]:
+    """
+    Merge the rollout events of each service (ECS only returns the latest
+    100) into the locally cached history. Events are stored as
+    ``[id, timestamp, kind, detail]``, oldest first.
+    """
+    history = cache.load(app.name, EVENTS_CACHE)
+    for service in services:
+        events = {e[0]: e for e in history.get(service["serviceName"], [])}
+        for e in service["events"]:
+            classified = _event_kind(e["message"])
+            if classified:
+                kind, detail = classified
+                events[e["id"]] = [e["id"], e["createdAt"].timestamp(), kind, detail]
+        history[service["serviceName"]] = sorted(
+            events.values(), key=lambda e: e[1]
+        )[-MAX_EVENTS:]
+    cache.save(app.name, EVENTS_CACHE, history)
+    return {s["serviceName"]: history[s["serviceName"]] for s in services}
+
+
+def rollouts(events: List[list], in_progress: bool = False) -> Iterator[dict]:
+    """
+    Rebuild deployments from service events (oldest first). A rollout starts
+    with the first task started after the service was steady and ends when it
+    reaches a steady state again. Only sequences ECS reports as a completed
+    deployment are rollouts, scaling and replacing failed tasks follow the
+    same pattern but aren't deployments. The last sequence is included, not
+    steady, if a deployment is ``in_progress``.
+    """
+    current = None
+    finished = None
+    for _, timestamp, kind, detail in events:
+        ts = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+        if kind == "completed":
+            # reported around the same time as the steady state, either side
+            if current is not None:
+                current["deployment"] = detail
+            elif finished is not None:
+                finished["deployment"] = detail
+                yield _rollout_record(finished)
+                finished = None
+            continue
+        if current is None:
+            if kind == "started":
+                if finished is not None and finished["deployment"]:
+                    yield _rollout_record(finished)
+                finished = None
+                current = {
+                    "deployment": None,
+                    "start": ts,
+                    "healthy": None,
+                    "steady": None,
+                    "problems": 0,
+                }
+        elif kind == "healthy" and current["healthy"] is None:
+            current["healthy"] = ts
+        elif kind == "problem":
+            current["problems"] += 1
+        elif kind == "steady":
+            current["steady"] = ts
+            finished, current = current, None
+    if finished is not None and finished["deployment"]:
+        yield _rollout_record(finished)
+    if current is not None and (current["deployment"] or in_progress):
+        yield _rollout_record(current)
+
+
+def _rollout_record(rollout: dict) -> dict:
+    def since_start(ts: Optional[datetime.datetime]) -> Optional[float]:
+        return (ts - rollout["start"]).total_seconds() if ts else None
+
+    return dict(
+        rollout,
+        timeToHealthy=since_start(rollout["healthy"]),
+        timeToSteady=since_start(rollout["steady"]),
+    )
+
+
+def history_record(service: dict, events: List[list]) -> dict:
+    """Rollouts of a service with time-to-steady percentiles"""
+    timeline = list(rollouts(events, in_progress=not is_steady(service)))
+    durations = [r["timeToSteady"] for r in timeline if r["timeToSteady"] is not None]
+    return {
+        "service": service["serviceName"],
+        "rollouts": timeline,
+        "count": len(durations),
+        "p50": percentile(durations, 50) if durations else None,
+        "p90": percentile(durations, 90) if durations else None,
+        "max": max(durations) if durations else None,
+        "since": timeline[0]["start"] if timeline else None,
+    }
+
+
+def _print_history(record: dict, timeline: bool) -> None:
+    line = [colored("===", attrs=["dark"]), colored(record["service"], "green")]
+    if record["count"]:
+        line.append(
+            "rollouts:{count} p50:{p50} p90:{p90} max:{max}".format(
+                count=record["count"],
+                **{k: format_duration(record[k]) for k in ("p50", "p90", "max")},
+            )
+        )
+    else:
+        line.append(colored("no completed rollouts", attrs=["dark"]))
+    print(*line)
+    if not timeline:
+        return
+    for r in record["rollouts"]:
+        steps = [formatted_time_ago(r["start"])]
+        if r["timeToHealthy"] is not None:
+            steps.append("healthy +" + format_duration(r["timeToHealthy"]))
+        if r["timeToSteady"] is not None:
+            steps.append(colored("steady +" + format_duration(r["timeToSteady"]), "green"))
+        else:
+            steps.append(colored("not steady", "yellow"))
+        if r["problems"]:
+            steps.append(colored(f"{r['problems']} problem event(s)", "red"))
+        print("    " + ", ".join(steps))
+    print("")
+
+
+@deployments.command()
+@click.argument("services", nargs=-1)
+@click.option("--timeline", "-t", is_flag=True, help="Show every rollout")
+def history(services, timeline):
+    """Rollout durations from service events"""
+    with spinner(text="fetching service events", spinner="dots"):
+        described = (
+            app.describe_services(sorted(services)) if services else app.get_services()
+        )
+    if services and len(described) != len(set(services)):
+        # only list every service when a name doesn't match
+        check_service_names(services, app.get_services())
+    events = load_service_events(described)
+    records = (
+        history_record(s, events[s["serviceName"]])
+        for s in sorted(described, key=lambda s: s["serviceName"])
+    )
+    if output.structured:
+        return output.emit(records)
+    for record in records:
+        _print_history(record, timeline)
@@ -0,0 +1,178 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import click
+from dateutil.parser import isoparse
+from termcolor import colored, cprint
+
+from ..output import output
+from ..snapshot import snapshots
+from ..utils import formatted_time_ago
+
+SECTIONS = ["tasks", "services", "parameters"]
+
+
+def _change(section: str, change: str, key: str, old: Any = None, new: Any = None) -> dict:
+    return {"section": section, "change": change, "key": key, "old": old, "new": new}
+
+
+def _keyed_changes(
+    section: str,
+    old: List[dict],
+    new: List[dict],
+    key: Callable[[dict], str],
+    fields: Dict[str, Callable[[dict], Any]],
+) -> Iterator[dict]:
+    """Added/removed records by ``key`` and changed ``fields`` of the rest"""
+    old_by_key = {key(r): r for r in old}
+    new_by_key = {key(r): r for r in new}
+    summary = next(iter(fields.values()))
+    for k in sorted(old_by_key.keys() | new_by_key.keys()):
+        if k not in new_by_key:
+            yield _change(section, "removed", k, old=summary(old_by_key[k]))
+        elif k not in old_by_key:
+            yield _change(section, "added", k, new=summary(new_by_key[k]))
+        else:
+            for field, value in fields.items():
+                before, after = value(old_by_key[k]), value(new_by_key[k])
+                if before != after:
+                    yield _change(section, field, k, old=before, new=after)
+
+
+def _primary_deployment(record: dict) -> Optional[dict]:
+    primary = [d for d in record["deployments"] if d["status"] == "PRIMARY"]
+    return primary[0] if primary else None
+
+
+def _task_definition_changes(old: List[dict], new: List[dict]) -> Iterator[dict]:
+    """Groups whose tasks run different container definitions"""
+
+    def digests(records: List[dict]) -> Dict[str, List[str]]:
+        by_group: Dict[str, set] = {}
+        for r in records:
+            by_group.setdefault(r["group"], set()).add(r["taskDefinitionDigest"])
+        return {group: sorted(d) for group, d in by_group.items()}
+
+    old_digests, new_digests = digests(old), digests(new)
+    for group in sorted(old_digests.keys() & new_digests.keys()):
+        if old_digests[group] != new_digests[group]:
+            yield _change(
+                "tasks", "definition", group, old=old_digests[group], new=new_digests[group]
+            )
+
+
+def section_changes(section: str, old: List[dict], new: List[dict]) -> Iterator[dict]:
+    if section == "tasks":
+        yield from _keyed_changes(
+            section,
+            old,
+            new,
+            key=lambda r: r["taskArn"].split("/")[-1],
+            fields={"status": lambda r: r["status"]},
+        )
+        yield from _task_definition_changes(old, new)
+    elif section == "services":
+        primary = lambda r: _primary_deployment(r) or {}
+        yield from _keyed_changes(
+            section,
+            old,
+            new,
+            key=lambda r: r["service"],
+            fields={
+                "deployment": lambda r: primary(r).get("id"),
+                "desiredCount": lambda r: primary(r).get("desiredCount"),
+                "deployments": lambda r: len(r["deployments"]),
+            },
+        )
+    elif section == "parameters":
+        yield from _keyed_changes(
+            section,
+            old,
+            new,
+            key=lambda r: r["name"],
+            fields={"version": lambda r: r["version"]},
+        )
+
+
+def snapshot_changes(old: dict, new: dict) -> Iterator[dict]:
+    """Changes between the sections both snapshots hold"""
+    for section in SECTIONS:
+        if section in old["sections"] and section in new["sections"]:
+            yield from section_changes(
+                section,
+                old["sections"][section]["records"],
+                new["sections"][section]["records"],
+            )
+
+
+def _change_line(record: dict) -> str:
+    if record["change"] == "added":
+        line = colored("+ " + record["key"], "green")
+        return line + " " + colored(str(record["new"]), attrs=["dark"])
+    if record["change"] == "removed":
+        line = colored("- " + record["key"], "red")
+        return line + " " + colored(str(record["old"]), attrs=["dark"])
+    return " ".join(
+        [
+            colored("~ " + record["key"], "yellow"),
+            record["change"] + ":",
+            str(record["old"]),
+            colored("->", attrs=["dark"]),
+            str(record["new"]),
+        ]
+    )
+
+
+def _list_snapshots() -> None:
+    records = []
+    for path in snapshots.paths():
+        snapshot = snapshots.load(path)
+        records.append(
+            {
+                "id": path.name.split(".")[0],
+                "createdAt": snapshot["createdAt"],
+                "sections": sorted(snapshot["sections"].keys()),
+            }
+        )
+    if output.structured:
+        return output.emit(records)
+    for r in records:
+        print(
+            r["id"],
+            formatted_time_ago(isoparse(r["createdAt"])),
+            colored(", ".join(r["sections"]), attrs=["dark"]),
+        )
+
+
+@click.command()
+@click.argument("old", default="-2")
+@click.argument("new", default="-1")
+@click.option(
+    "--list",
+    "list_",
+    is_flag=True,
+    help="List stored snapshots (written by commands run with --snapshot or "
+    "PAAWS_SNAPSHOT=1), OLD and NEW are their ids or negative indexes",
+)
+def diff(old, new, list_):
+    """Compare two local snapshots (the previous and latest by default)"""
+    if list_:
+        return _list_snapshots()
+    old_path, new_path = snapshots.find(old), snapshots.find(new)
+    old_snapshot, new_snapshot = snapshots.load(old_path), snapshots.load(new_path)
+    changes = snapshot_changes(old_snapshot, new_snapshot)
+    if output.structured:
+        return output.emit(changes)
+    print(
+        colored("===", attrs=["dark"]),
+        colored(old_path.name.split(".")[0], "white"),
+        colored("->", attrs=["dark"]),
+        colored(new_path.name.split(".")[0], "white", attrs=["bold"]),
+    )
+    section = None
+    for record in changes:
+        if record["section"] != section:
+            section = record["section"]
+            cprint(section, "green")
+        print("  " + _change_line(record))
+    if section is None:
+        cprint("no changes", attrs=["dark"])
@@ -1,12 +1,20 @@
-from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import boto3
 import click
-from halo import Halo
 from termcolor import colored, cprint
 
 from ..app import app
-from ..utils import formatted_time_ago
+from ..output import output
+from ..snapshot import cached_options, cached_section, digest, snapshots
+from ..utils import (
+    formatted_time_ago,
+    get_latest_metrics,
+    metric_query,
+    ordered_map,
+    print_snapshot_age,
+    spinning,
+)
 
 
 def task_id(task_detail: dict) -> str:
@@ -17,65 +25,242 @@ def task_id(task_detail: dict) -> str:
         return task_detail["taskArn"].split("/")[-1]
 
 
-@click.command()
-def ps():
-    """Show running containers"""
+def _container_command(task: dict, container: dict, defn: dict) -> List[str]:
+    try:
+        return [
+            o["command"]
+            for o in task["overrides"]["containerOverrides"]
+            if o["name"] == container["name"]
+        ][0]
+    except (KeyError, IndexError):
+        return [
+            cd.get("command", ["[container default cmd]"])
+            for cd in defn["containerDefinitions"]
+            if cd["name"] == container["name"]
+        ][0]
+
+
+def fetch_usage(
+    tasks: List[dict], task_definitions: Dict[str, dict], cloudwatch=None
+) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+    """
+    Utilization by task ARN (Container Insights) and by group (ECS service
+    metrics), fetched with as few get_metric_data calls as possible.
+    """
+    queries = []
+    for idx, t in enumerate(tasks):
+        dimensions = {
+            "ClusterName": app.cluster,
+            "TaskDefinitionFamily": task_definitions[t["taskDefinitionArn"]]["family"],
+            "TaskId": t["taskArn"].split("/")[-1],
+        }
+        queries.append(
+            metric_query(f"t{idx}cpu", "ECS/ContainerInsights", "CpuUtilized", dimensions)
+        )
+        queries.append(
+            metric_query(f"t{idx}mem", "ECS/ContainerInsights", "MemoryUtilized", dimensions)
+        )
+    groups = sorted({t["group"] for t in tasks if t["group"].startswith("service:")})
+    for idx, group in enumerate(groups):
+        dimensions = {"ClusterName": app.cluster, "ServiceName": group.split(":", 1)[1]}
+        queries.append(metric_query(f"s{idx}cpu", "AWS/ECS", "CPUUtilization", dimensions))
+        queries.append(
+            metric_query(f"s{idx}mem", "AWS/ECS", "MemoryUtilization", dimensions)
+        )
+    values = get_latest_metrics(queries, cloudwatch=cloudwatch)
+    by_task = {
+        t["taskArn"]: {
+            # CpuUtilized is in CPU units, show it relative to the reservation
+            "cpu": values[f"t{idx}cpu"] / int(t["cpu"]) * 100
+            if f"t{idx}cpu" in values
+            else None,
+            "memory": values.get(f"t{idx}mem"),
+        }
+        for idx, t in enumerate(tasks)
+    }
+    by_group = {
+        group: {"cpu": values.get(f"s{idx}cpu"), "memory": values.get(f"s{idx}mem")}
+        for idx, group in enumerate(groups)
+    }
+    return by_task, by_group
+
+
+def task_record(task: dict, defn: dict, defn_digest: str) -> dict:
+    """Flatten a task description into what ``ps`` displays"""
+    return {
+        "id": task_id(task),
+        "group": task["group"],
+        "taskArn": task["taskArn"],
+        "taskDefinition": task["taskDefinitionArn"],
+        "taskDefinitionDigest": defn_digest,
+        "cpu": int(task["cpu"]) / 1024,
+        "memory": task["memory"],
+        "status": task["lastStatus"].lower(),
+        "startedAt": task.get("startedAt"),
+        "containers": [
+            {
+                "name": c["name"],
+                "command": _container_command(task, c, defn),
+                "image": c["image"].split("/")[-1],
+                "status": c["lastStatus"].lower(),
+            }
+            for c in task["containers"]
+        ],
+    }
+
+
+def _usage_batches(
+    groups: Iterable[Tuple[str, List[dict]]], max_queries: int = 500
+) -> Iterator[List[Tuple[str, List[dict]]]]:
+    """
+    Collect groups until their queries (cpu and memory for each task and group)
+    fill a get_metric_data call
+    """
+    batch, size = [], 0
+    for group, tasks in groups:
+        queries = 2 * len(tasks) + 2
+        if batch and size + queries > max_queries:
+            yield batch
+            batch, size = [], 0
+        batch.append((group, tasks))
+        size += queries
+        if size >= max_queries:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+def task_records(usage: bool = False) -> Iterator[dict]:
+    """
+    Task records, one group at a time as soon as the group has been described,
+    optionally with their utilization
+    """
     ecs = boto3.client("ecs")
-    with Halo(text="fetching container information", spinner="dots"):
-        tasks = app.get_tasks()
-        tasks_by_group = defaultdict(list)
-        task_definitions = {}
-        for t in tasks:
-            tasks_by_group[t["group"]].append(t)
-            if t["taskDefinitionArn"] not in task_definitions:
-                task_definitions[t["taskDefinitionArn"]] = ecs.describe_task_definition(
-                    taskDefinition=t["taskDefinitionArn"]
-                )["taskDefinition"]
-    for group in sorted(tasks_by_group.keys()):
-        tasks = tasks_by_group[group]
-        defn = task_definitions[tasks[0]["taskDefinitionArn"]]
-        print(colored("===", attrs=["dark"]), colored(group, "green"))
+    cloudwatch = boto3.client("cloudwatch") if usage else None
+    task_definitions: Dict[str, dict] = {}
+    digests: Dict[str, str] = {}
+
+    def describe_definitions(group: Tuple[str, List[dict]]) -> Tuple[str, List[dict]]:
+        # task definitions are immutable, so they're only described once per run
+        for arn in {t["taskDefinitionArn"] for t in group[1]} - task_definitions.keys():
+            defn = ecs.describe_task_definition(taskDefinition=arn)["taskDefinition"]
+            digests[arn] = digest(defn["containerDefinitions"])
+            task_definitions[arn] = defn
+        return group
+
+    def with_usage(groups):
+        for batch in _usage_batches(groups):
+            tasks = [t for _, group_tasks in batch for t in group_tasks]
+            usage_by_task, usage_by_group = fetch_usage(
+                tasks, task_definitions, cloudwatch
+            )
+            for group, group_tasks in batch:
+                yield group, group_tasks, usage_by_group.get(group), usage_by_task
+
+    # describe task definitions for the next groups while one is rendered
+    groups = ordered_map(describe_definitions, app.iter_task_groups())
+    if usage:
+        groups = with_usage(groups)
+    else:
+        groups = ((group, tasks, None, None) for group, tasks in groups)
+    for group, tasks, group_usage, usage_by_task in spinning(
+        groups, "fetching container information"
+    ):
         for t in tasks:
-            task_line = [
-                task_id(t),
-                " ",
-                colored("(", "white"),
-                colored(
-                    "cpu:{cpu} mem:{memory}".format(
-                        cpu=int(t["cpu"]) / 1024, memory=t["memory"]
-                    ),
-                    "blue",
-                    attrs=["dark", "bold"],
-                ),
-                colored(")", "white"),
-                ": ",
-                t["lastStatus"].lower(),
-                " ",
-            ]
-            if "startedAt" in t:
-                task_line.append(formatted_time_ago(t["startedAt"]))
-            print("".join(task_line))
-            for c in t["containers"]:
-                try:
-                    command = [
-                        o["command"]
-                        for o in t["overrides"]["containerOverrides"]
-                        if o["name"] == c["name"]
-                    ][0]
-                except (KeyError, IndexError):
-                    command = [
-                        cd.get("command", ["[container default cmd]"])
-                        for cd in defn["containerDefinitions"]
-                        if cd["name"] == c["name"]
-                    ][0]
-                print_name = f"  {c['name']}:"
-                indent = len(print_name) + 1
-                print(print_name, colored(" ".join(command), "white"))
-                container_line2 = [
-                    " " * indent,
-                    "{image} {status}".format(
-                        image=c["image"].split("/")[-1], status=c["lastStatus"].lower()
-                    ),
+            arn = t["taskDefinitionArn"]
+            record = task_record(t, task_definitions[arn], digests[arn])
+            if usage:
+                record["usage"] = usage_by_task[t["taskArn"]]
+                record["groupUsage"] = group_usage
+            yield record
+
+
+def _usage_text(usage: Optional[dict], memory_unit: str) -> str:
+    """Utilization as ``cpu:12% mem:300`` with ``?`` for missing datapoints"""
+    if not usage:
+        return "cpu:? mem:?"
+    cpu = "?" if usage["cpu"] is None else "{:.0f}%".format(usage["cpu"])
+    mem = "?" if usage["memory"] is None else "{:.0f}{}".format(usage["memory"], memory_unit)
+    return f"cpu:{cpu} mem:{mem}"
+
+
+def print_tasks(records: Iterable[dict]) -> None:
+    group = None
+    for record in records:
+        if record["group"] != group:
+            if group is not None:
+                print("")
+            group = record["group"]
+            header = [colored("===", attrs=["dark"]), colored(group, "green")]
+            if record.get("groupUsage"):
+                header.append(
+                    colored(_usage_text(record["groupUsage"], "%"), "magenta")
+                )
+            print(*header)
+        task_line = [
+            record["id"],
+            " ",
+            colored("(", "white"),
+            colored(
+                "cpu:{cpu} mem:{memory}".format(**record),
+                "blue",
+                attrs=["dark", "bold"],
+            ),
+            colored(")", "white"),
+        ]
+        if "usage" in record:
+            task_line.extend(
+                [
+                    " ",
+                    colored("used ", "white"),
+                    colored(_usage_text(record["usage"], ""), "magenta"),
                 ]
-                cprint("".join(container_line2), attrs=["dark"])
+            )
+        task_line += [
+            ": ",
+            record["status"],
+            " ",
+        ]
+        if record["startedAt"]:
+            task_line.append(formatted_time_ago(record["startedAt"]))
+        print("".join(task_line))
+        for c in record["containers"]:
+            print_name = f"  {c['name']}:"
+            indent = len(print_name) + 1
+            print(print_name, colored(" ".join(c["command"]), "white"))
+            cprint(" " * indent + "{image} {status}".format(**c), attrs=["dark"])
+    if group is not None:
         print("")
+
+
+@click.command()
+@click.option(
+    "--usage",
+    "-u",
+    is_flag=True,
+    help="Show CPU/memory utilization (requires Container Insights for tasks)",
+)
+@cached_options
+def ps(usage, max_age):
+    """Show running containers"""
+    if usage and max_age is not None:
+        raise click.UsageError("--usage can't be combined with --cached or --max-age")
+    cached = cached_section("tasks", max_age)
+    if cached:
+        records = iter(cached["records"])
+    else:
+        # utilization is only meaningful live, keep it out of snapshots
+        records = snapshots.tee(
+            "tasks",
+            task_records(usage),
+            project=lambda r: {
+                k: v for k, v in r.items() if k not in ("usage", "groupUsage")
+            },
+        )
+    if output.structured:
+        output.emit(records)
+    else:
+        if cached:
+            print_snapshot_age(cached)
+        print_tasks(records)
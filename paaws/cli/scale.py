@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import boto3
+import click
+from botocore.client import ClientError
+from halo import Halo
+
+from ..app import app
+from ..utils import spinner
+from .deployments import _watch_deployment, check_service_names
+
+
+def update_services(updates: Dict[str, dict], max_workers: int = 8) -> Dict[str, Optional[str]]:
+    """
+    Call update_service for every service concurrently. Returns the error
+    message for each service, None if the update succeeded.
+    """
+    ecs = boto3.client("ecs")
+
+    def update(name: str) -> Optional[str]:
+        try:
+            ecs.update_service(cluster=app.cluster, service=name, **updates[name])
+        except ClientError as e:
+            return e.response["Error"]["Message"]
+        return None
+
+    names = sorted(updates)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(names, executor.map(update, names)))
+
+
+def _apply_updates(updates: Dict[str, dict], message: str, wait: bool) -> None:
+    with spinner(text=message, spinner="dots"):
+        errors = update_services(updates)
+    for name, error in errors.items():
+        if error:
+            Halo(text=f"{name}: {error}").fail()
+    updated = [name for name, error in errors.items() if not error]
+    if updated and wait:
+        _watch_deployment(updated)
+    if len(updated) != len(updates):
+        exit(1)
+
+
+def _check_service_names(names: List[str]) -> List[str]:
+    """Validate names against the app's services, exiting on unknown ones"""
+    with spinner(text="fetching services", spinner="dots"):
+        services = app.get_services()
+    check_service_names(names, services)
+    return names or [s["serviceName"] for s in services]
+
+
+@click.command()
+@click.argument("counts", nargs=-1, required=True)
+@click.option("--no-wait", is_flag=True, help="Don't wait for services to settle")
+def scale(counts, no_wait):
+    """Scale services using SERVICE=COUNT format"""
+    try:
+        desired = {name: int(n) for name, n in (c.split("=", 1) for c in counts)}
+    except ValueError:
+        raise click.BadParameter("use SERVICE=COUNT, e.g. web=4", param_hint="COUNTS")
+    _check_service_names(sorted(desired))
+    _apply_updates(
+        {name: {"desiredCount": count} for name, count in desired.items()},
+        f"scaling {len(desired)} service(s)",
+        wait=not no_wait,
+    )
+
+
+@click.command()
+@click.argument("services", nargs=-1)
+@click.option("--no-wait", is_flag=True, help="Don't wait for services to settle")
+def restart(services, no_wait):
+    """Restart services (all services if none are given)"""
+    names = _check_service_names(sorted(services))
+    _apply_updates(
+        {name: {"forceNewDeployment": True} for name in names},
+        f"restarting {len(names)} service(s)",
+        wait=not no_wait,
+    )
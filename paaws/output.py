@@ -0,0 +1,48 @@
+"""Machine-readable output for commands"""
+import datetime
+import json
+import sys
+from typing import Any, Iterable
+
+FORMATS = ["text", "json", "ndjson"]
+
+
+def json_default(obj: Any) -> Any:
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+class Output:
+    format: str = "text"
+
+    @property
+    def structured(self) -> bool:
+        """Are records emitted as JSON instead of rendered for a terminal?"""
+        return self.format != "text"
+
+    def _write(self, text: str) -> None:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    def emit(self, records: Iterable[dict]) -> None:
+        """
+        Write each record as soon as it is produced. NDJSON writes one object per
+        line, JSON writes a single array which is streamed element by element.
+        """
+        if self.format == "ndjson":
+            for record in records:
+                self._write(json.dumps(record, default=json_default) + "\n")
+            return
+        separator = "[\n"
+        for record in records:
+            self._write(separator + "  " + json.dumps(record, default=json_default))
+            separator = ",\n"
+        self._write("[]\n" if separator == "[\n" else "\n]\n")
+
+    def emit_one(self, record: dict) -> None:
+        """Write a single record (for commands describing one object)"""
+        self._write(json.dumps(record, default=json_default) + "\n")
+
+
+output = Output()
@@ -0,0 +1,203 @@
+"""Local snapshots of application state for offline reads and diffs"""
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+import click
+from dateutil.parser import isoparse
+from termcolor import cprint
+
+from .app import app
+from .cache import cache_dir
+from .output import json_default
+
+VERSION = 1
+
+# Snapshots kept per application, older ones are pruned on write
+KEEP = 200
+
+DURATION_RE = re.compile(r"^(\d+)([smhd]?)$")
+
+
+def parse_max_age(value: str) -> int:
+    """Seconds from ``90``, ``90s``, ``5m``, ``2h`` or ``1d``"""
+    match = DURATION_RE.match(value.strip())
+    if not match:
+        raise click.BadParameter(f"{value!r} is not a duration like 30s, 5m or 2h")
+    number, unit = match.groups()
+    return int(number) * {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}[unit]
+
+
+def digest(obj: Any) -> str:
+    """Short, stable hash of a JSON-serializable object"""
+    data = json.dumps(obj, sort_keys=True, default=json_default).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _revive(obj: Any) -> Any:
+    """Turn ISO timestamps of ``...At``/``...Time`` fields back into datetimes"""
+    if isinstance(obj, list):
+        return [_revive(v) for v in obj]
+    if isinstance(obj, dict):
+        return {
+            k: isoparse(v)
+            if isinstance(v, str) and (k.endswith("At") or k.endswith("Time"))
+            else _revive(v)
+            for k, v in obj.items()
+        }
+    return obj
+
+
+class SnapshotStore:
+    """
+    Versioned snapshots stored as gzipped JSON in the cache directory. Each
+    snapshot carries every section (tasks, services, parameters) seen so far;
+    a command writing one section copies the rest from the previous snapshot.
+    """
+
+    enabled: bool = False
+
+    @property
+    def directory(self) -> Path:
+        return cache_dir(app.name) / "snapshots"
+
+    def paths(self) -> List[Path]:
+        """Snapshot files, oldest first"""
+        try:
+            return sorted(self.directory.glob("*.json.gz"))
+        except OSError:
+            return []
+
+    def load(self, path: Path) -> dict:
+        with gzip.open(str(path), "rt") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != VERSION:
+            raise click.ClickException(
+                f"Snapshot {path.name} has unsupported version {snapshot.get('version')}"
+            )
+        return snapshot
+
+    def find(self, name: str) -> Path:
+        """Snapshot by id (file name prefix) or negative index (-1 is the latest)"""
+        snapshots = self.paths()
+        if re.match(r"^-\d+$", name):
+            try:
+                return snapshots[int(name)]
+            except IndexError:
+                raise click.ClickException(f"Only {len(snapshots)} snapshot(s) exist")
+        matches = [p for p in snapshots if p.name.startswith(name)]
+        if len(matches) != 1:
+            raise click.ClickException(
+                f"{len(matches)} snapshots match {name!r}, use `paaws diff --list`"
+            )
+        return matches[0]
+
+    def latest(self) -> Optional[dict]:
+        snapshots = self.paths()
+        return self.load(snapshots[-1]) if snapshots else None
+
+    def read_section(self, section: str, max_age: Optional[int]) -> Optional[dict]:
+        """
+        Latest stored section if it is younger than ``max_age`` seconds (any age
+        if None), with timestamps turned back into datetimes. Every snapshot
+        carries the sections of the previous one, so only the latest is read.
+        """
+        snapshot = self.latest()
+        if snapshot is None or section not in snapshot["sections"]:
+            return None
+        stored = snapshot["sections"][section]
+        fetched = isoparse(stored["fetchedAt"])
+        age = datetime.datetime.now(datetime.timezone.utc) - fetched
+        if max_age is not None and age.total_seconds() > max_age:
+            return None
+        return dict(_revive(stored), fetchedAt=fetched)
+
+    def write_section(self, section: str, data: dict) -> Path:
+        """Write a new snapshot with ``section`` replaced"""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        previous = self.latest()
+        snapshot = {
+            "version": VERSION,
+            "app": app.name,
+            "createdAt": now.isoformat(),
+            "sections": previous["sections"] if previous else {},
+        }
+        snapshot["sections"][section] = dict(data, fetchedAt=now.isoformat())
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / (now.strftime("%Y%m%dT%H%M%S%f") + ".json.gz")
+        tmp = path.with_suffix(".tmp")
+        with gzip.open(str(tmp), "wt") as f:
+            json.dump(snapshot, f, default=json_default, separators=(",", ":"))
+        os.replace(str(tmp), str(path))
+        for old in self.paths()[:-KEEP]:
+            old.unlink()
+        return path
+
+    def tee(
+        self,
+        section: str,
+        records: Iterable[dict],
+        project: Optional[Callable[[dict], dict]] = None,
+    ) -> Iterator[dict]:
+        """
+        Pass records through and, if snapshots are enabled, store them (or
+        what ``project`` keeps of them) once the listing is complete.
+        """
+        if not self.enabled:
+            yield from records
+            return
+        seen = []
+        for record in records:
+            seen.append(project(record) if project else record)
+            yield record
+        self.write_section(section, {"records": seen})
+
+
+snapshots = SnapshotStore()
+
+
+def cached_options(func):
+    """
+    Add ``--cached``/``--max-age`` to a command. The command receives
+    ``max_age``: None to fetch from AWS, -1 for a snapshot of any age or the
+    maximum age in seconds. A live fetch made because no usable snapshot was
+    found is stored for the next cached read.
+    """
+
+    @click.option(
+        "--cached", is_flag=True, help="Read from the latest local snapshot"
+    )
+    @click.option(
+        "--max-age",
+        help="Read from a local snapshot no older than this (e.g. 30s, 5m, 2h)",
+    )
+    @wraps(func)
+    def wrapper(*args, cached: bool, max_age: Optional[str], **kwargs):
+        if max_age is not None:
+            kwargs["max_age"] = parse_max_age(max_age)
+        else:
+            kwargs["max_age"] = -1 if cached else None
+        if kwargs["max_age"] is not None:
+            snapshots.enabled = True
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def cached_section(section: str, max_age: Optional[int]) -> Optional[dict]:
+    """Section to serve a read from, None if it has to come from AWS"""
+    if max_age is None:
+        return None
+    stored = snapshots.read_section(section, None if max_age < 0 else max_age)
+    if stored is None:
+        # stderr keeps JSON output on stdout intact
+        missing = "No snapshot" if max_age < 0 else f"No snapshot from the last {max_age}s"
+        cprint(f"{missing} of {section}, fetching from AWS", "yellow", file=sys.stderr)
+    return stored
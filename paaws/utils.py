@@ -1,21 +1,64 @@
 import datetime
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getuser
 from contextlib import contextmanager
-from typing import List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
 
 import boto3
 import timeago
 from halo import Halo
-from termcolor import colored
+from termcolor import colored, cprint
+
+from .output import output
+
+
+def spinner(*args, **kwargs) -> Halo:
+    """Halo spinner which stays quiet when structured output is requested"""
+    kwargs.setdefault("enabled", not output.structured)
+    return Halo(*args, **kwargs)
 
 
 @contextmanager
 def halo_success(*args, **kwargs):
-    spinner = Halo(*args, **kwargs)
+    s = spinner(*args, **kwargs)
     try:
-        yield spinner.start()
+        yield s.start()
     finally:
-        spinner.succeed()
+        s.succeed()
+
+
+def spinning(items: Iterable, text: str) -> Iterator:
+    """
+    Yield from ``items`` with a spinner until the first one arrives, after that
+    the output shows progress (stopping a spinner takes up to one frame)
+    """
+    items = iter(items)
+    with spinner(text=text, spinner="dots"):
+        try:
+            first = next(items)
+        except StopIteration:
+            return
+    yield first
+    yield from items
+
+
+def ordered_map(
+    func: Callable[[Any], Any], items: Iterable, max_workers: int = 8
+) -> Iterator:
+    """
+    Concurrent ``map`` which reads ``items`` lazily and yields results in order
+    as soon as they are ready, with at most ``max_workers`` calls in flight.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
 
 def tags_match(tags: List[dict], expected_tags: List[dict]) -> bool:
@@ -23,10 +66,59 @@ def tags_match(tags: List[dict], expected_tags: List[dict]) -> bool:
     return all([tag in tags for tag in expected_tags])
 
 
+def metric_query(
+    query_id: str, namespace: str, metric: str, dimensions: Dict[str, str]
+) -> dict:
+    """One-minute average of a metric for get_metric_data"""
+    return {
+        "Id": query_id,
+        "MetricStat": {
+            "Metric": {
+                "Namespace": namespace,
+                "MetricName": metric,
+                "Dimensions": [{"Name": k, "Value": v} for k, v in dimensions.items()],
+            },
+            "Period": 60,
+            "Stat": "Average",
+        },
+    }
+
+
+def get_latest_metrics(
+    queries: List[dict], minutes: int = 10, cloudwatch=None
+) -> Dict[str, float]:
+    """
+    Most recent value of each metric query. get_metric_data accepts up to 500
+    queries, so they are packed into as few calls as possible.
+    """
+    cloudwatch = cloudwatch or boto3.client("cloudwatch")
+    end = datetime.datetime.now(datetime.timezone.utc)
+    kwargs = {
+        "StartTime": end - datetime.timedelta(minutes=minutes),
+        "EndTime": end,
+        "ScanBy": "TimestampDescending",
+    }
+    values = {}
+    for i in range(0, len(queries), 500):
+        kwargs.pop("NextToken", None)
+        while True:
+            resp = cloudwatch.get_metric_data(
+                MetricDataQueries=queries[i : i + 500], **kwargs
+            )
+            for result in resp["MetricDataResults"]:
+                # newest first, so keep the first value seen for each query
+                if result["Values"] and result["Id"] not in values:
+                    values[result["Id"]] = result["Values"][0]
+            if "NextToken" not in resp:
+                break
+            kwargs["NextToken"] = resp["NextToken"]
+    return values
+
+
 def wait_for_task(
     cluster: str, arn: str, message: str = "running task", status: str = "tasks_stopped"
 ) -> None:
-    spinner = Halo(text=message, spinner="dots").start()
+    s = spinner(text=message, spinner="dots").start()
     ecs = boto3.client("ecs")
     ecs.get_waiter(status).wait(cluster=cluster, tasks=[arn])
     if status == "tasks_stopped":
@@ -34,9 +126,9 @@ def wait_for_task(
             "containers"
         ][0]
         if int(container.get("exitCode", "255")) > 0:
-            spinner.fail()
+            s.fail()
             exit(1)
-    spinner.succeed()
+    s.succeed()
 
 
 def run_task_until_disconnect(cluster: str, task_defn: str) -> Optional[dict]:
@@ -94,7 +186,22 @@ def run_task_until_disconnect(cluster: str, task_defn: str) -> Optional[dict]:
 
 
 
+def print_snapshot_age(section: dict) -> None:
+    cprint("(snapshot from " + formatted_time_ago(section["fetchedAt"]) + ")", attrs=["dark"])
+
+
 def formatted_time_ago(dt: datetime) -> str:
     ago = timeago.format(dt, datetime.datetime.now(datetime.timezone.utc))
     full = dt.isoformat(timespec="seconds")
     return colored(f"{full} ~ {ago}", attrs=["dark"])
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s"